@@ -0,0 +1,306 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tools shared by the benchmarks.
+
+The benchmarks are run outside of Anki, with `python benchmarks/<name>.py`.
+Only the add-on's modules which do not import anki or aqt can be loaded
+by `addonModule`."""
+
+import importlib
+import json
+import math
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+import types
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+ADDON_PACKAGE = "enhance_main_window_card_stages"
+
+# Timestamps of the synthetic collections.
+NOW = 1_700_000_000
+DAY_CUTOFF = NOW + 5*3600
+TODAY = 1000
+
+
+def addonModule(name):
+    """Import the add-on's module `name` without executing the add-on's __init__."""
+    if ADDON_PACKAGE not in sys.modules:
+        package = types.ModuleType(ADDON_PACKAGE)
+        package.__path__ = [ADDON_DIR]
+        sys.modules[ADDON_PACKAGE] = package
+    return importlib.import_module(f"{ADDON_PACKAGE}.{name}")
+
+
+class DB:
+    """The subset of Anki's DBProxy used by the add-on, on a sqlite connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def all(self, sql, *args):
+        return self.conn.execute(sql, args).fetchall()
+
+    def list(self, sql, *args):
+        return [row[0] for row in self.conn.execute(sql, args)]
+
+    def execute(self, sql, *args):
+        self.conn.execute(sql, args)
+
+    def scalar(self, sql, *args):
+        row = self.conn.execute(sql, args).fetchone()
+        return row[0] if row else None
+
+
+SCHEMA = """
+create table cards (id integer primary key, nid integer not null, did integer not null,
+    ord integer not null, mod integer not null, usn integer not null, type integer not null,
+    queue integer not null, due integer not null, ivl integer not null, factor integer not null,
+    reps integer not null, lapses integer not null, left integer not null, odue integer not null,
+    odid integer not null, flags integer not null, data text not null);
+create table revlog (id integer primary key, cid integer not null, usn integer not null,
+    ease integer not null, ivl integer not null, lastIvl integer not null, factor integer not null,
+    time integer not null, type integer not null);
+create index ix_cards_usn on cards (usn);
+create index ix_revlog_usn on revlog (usn);
+create index ix_cards_nid on cards (nid);
+create index ix_cards_sched on cards (did, queue, due);
+create index ix_revlog_cid on revlog (cid);
+"""
+
+
+def makeDecks(decks=100, depth=3, seed=0):
+    """Associate to deck ids a deck dictionary, as in anki's decks.get.
+
+    The first deck is the default one. Each other deck is a child of a
+    random previous deck of depth less than `depth`."""
+    rnd = random.Random(seed)
+    result = {1: {"id": 1, "name": "Default", "conf": 1, "collapsed": False, "dyn": 0, "mod": NOW}}
+    candidates = [None]
+    for i in range(decks):
+        did = 1000 + i
+        parent = rnd.choice(candidates)
+        name = f"Deck {i}" if parent is None else f"{result[parent]['name']}::Deck {i}"
+        result[did] = {"id": did, "name": name, "conf": 1, "collapsed": False, "dyn": 0, "mod": NOW}
+        if name.count("::") < depth - 1:
+            candidates.append(did)
+    return result
+
+
+# Associate to each card queue its weight in the synthetic collections
+QUEUE_MIX = {-3: 1, -2: 1, -1: 1, 0: 3, 1: 1, 2: 4, 3: 1, 4: 1}
+
+
+def parseQueueMix(text):
+    """The queue mix of a text such as "0:3,1:1,2:4"."""
+    mix = dict()
+    for pair in text.split(","):
+        queue, weight = pair.split(":")
+        mix[int(queue)] = int(weight)
+    return mix
+
+
+def makeCollection(path=":memory:", decks=100, cards=100_000, depth=3, seed=0,
+                   notes=None, reviews=None, queueMix=None):
+    """A sqlite database with Anki's cards and revlog tables filled randomly.
+
+    notes -- the number of note ids the cards are randomly given, by default half the cards
+    reviews -- the number of revlog rows, by default one per card
+    queueMix -- associate to each queue its weight, by default QUEUE_MIX
+
+    Return the connection and the dictionary of decks, see makeDecks."""
+    if notes is None:
+        notes = cards//2
+    if reviews is None:
+        reviews = cards
+    if queueMix is None:
+        queueMix = QUEUE_MIX
+    queues = [queue for queue, weight in queueMix.items() for _ in range(weight)]
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    deckDicts = makeDecks(decks, depth, seed)
+    dids = list(deckDicts)
+    rows = []
+    for cid in range(1, cards + 1):
+        queue = rnd.choice(queues)
+        if queue in (1, 4):
+            due = NOW + rnd.randint(-600, 3*3600)
+        elif queue in (2, 3):
+            due = TODAY + rnd.randint(-10, 40)
+        else:
+            due = rnd.randint(0, 10_000)
+        ivl = rnd.randint(1, 100) if queue == 2 else 0
+        rows.append((cid, rnd.randint(1, max(1, notes)), rnd.choice(dids), 0,
+                     NOW - rnd.randint(0, 10**6), 0, 0, queue, due, ivl, 2500,
+                     rnd.randint(0, 20), 0, rnd.randint(0, 3003), 0, 0, 0, ""))
+    conn.executemany(
+        "insert into cards values (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+    revlog = []
+    for i in range(reviews):
+        revlogId = (DAY_CUTOFF - rnd.randint(0, 30*86400))*1000 + i
+        revlog.append((revlogId, rnd.randint(1, cards), 0, 3, 1, 1, 2500, 1000, 1))
+    conn.executemany(
+        "insert or ignore into revlog values (?,?,?,?,?,?,?,?,?)", revlog)
+    conn.commit()
+    return conn, deckDicts
+
+
+#################
+# Running the add-on outside of anki
+#################
+class DeckTreeNode:
+    """The fields of anki's DeckTreeNode read by the add-on."""
+
+    def __init__(self, name, deck_id, children):
+        self.name = name
+        self.deck_id = deck_id
+        self.review_count = 0
+        self.learn_count = 0
+        self.new_count = 0
+        self.children = children
+
+
+def deckTree(decks):
+    """The root of the DeckTreeNode tree of the decks from makeDecks."""
+    byParent = dict()
+    for did, deck in decks.items():
+        parentName = deck["name"].rpartition("::")[0]
+        byParent.setdefault(parentName, []).append(did)
+
+    def children(name):
+        return [DeckTreeNode(decks[did]["name"].rpartition("::")[2], did, children(decks[did]["name"]))
+                for did in byParent.get(name, [])]
+    return DeckTreeNode("", 0, children(""))
+
+
+class Decks:
+    """The part of anki's DeckManager used by the add-on."""
+
+    def __init__(self, decks):
+        self.decks = decks
+        self.byName = {deck["name"]: deck for deck in decks.values()}
+
+    def get(self, did, default=True):
+        return self.decks.get(did)
+
+    def parents(self, did):
+        parents = []
+        name = self.decks[did]["name"]
+        while "::" in name:
+            name = name.rpartition("::")[0]
+            parents.insert(0, self.byName[name])
+        return parents
+
+    def config_dict_for_deck_id(self, did):
+        return {"id": 1, "name": "Default"}
+
+
+def makeMainWindow(conn, decks, config=None):
+    """An object with the attributes of aqt.mw used by the add-on.
+
+    config -- the add-on's configuration, by default config.json"""
+    if config is None:
+        with open(os.path.join(ADDON_DIR, "config.json"), encoding="utf-8") as f:
+            config = json.load(f)
+    collectionConfig = {"collapseTime": 1200, "curDeck": 1}
+    mw = types.SimpleNamespace()
+    mw.state = "deckBrowser"
+    mw.col = types.SimpleNamespace(
+        db=DB(conn), decks=Decks(decks), mod=NOW*1000, path=":memory:",
+        get_config=lambda key, default=None: collectionConfig.get(key, default),
+        sched=types.SimpleNamespace(today=TODAY, day_cutoff=DAY_CUTOFF,
+                                    deck_due_tree=lambda: deckTree(decks)))
+    mw.pm = types.SimpleNamespace(meta={"defaultLang": "en"})
+    mw.addonManager = types.SimpleNamespace(
+        getConfig=lambda module: config,
+        writeConfig=lambda module, conf: None,
+        setConfigUpdatedAction=lambda module, action: None)
+    return mw
+
+
+def installAnki(mw):
+    """Register modules `anki` and `aqt` with the few names the add-on imports, `aqt.mw` being mw.
+
+    Must be called before addonModule loads a module importing anki or aqt.
+    Does nothing if anki is installed."""
+    try:
+        import aqt
+        aqt.mw = mw
+        return
+    except ImportError:
+        pass
+    modules = {name: types.ModuleType(name) for name in [
+        "anki", "anki.utils", "anki.stats", "aqt", "aqt.qt", "aqt.utils", "aqt.deckbrowser"]}
+    modules["anki.utils"].int_time = lambda scale=1: int(NOW*scale)
+    modules["anki.utils"].ids2str = lambda ids: "(%s)" % ",".join(str(id) for id in ids)
+    for name in ["colLearn", "colMature", "colRelearn", "colSusp", "colUnseen", "colYoung", "colCum"]:
+        setattr(modules["anki.stats"], name, "black")
+    modules["aqt"].mw = mw
+    modules["aqt.qt"].QLocale = lambda: types.SimpleNamespace(name=lambda: "en_US")
+    modules["aqt.qt"].__all__ = ["QLocale"]
+    modules["aqt.utils"].downArrow = lambda: "v"
+    modules["aqt.deckbrowser"].DeckBrowser = type("DeckBrowser", (), {})
+    sys.modules.update(modules)
+
+
+def measure(function, repeat=5):
+    """Call function `repeat` times, return the list of durations in seconds and the last result."""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - start)
+    return durations, result
+
+
+def percentile(durations, fraction):
+    """The duration below which `fraction` of the durations are, by the nearest rank."""
+    ordered = sorted(durations)
+    rank = max(1, math.ceil(fraction*len(ordered)))
+    return ordered[rank - 1]
+
+
+def summary(durations, items=None):
+    """The latencies in milliseconds of durations, and the number of
+    items processed by second if `items` are processed by each call."""
+    result = {
+        "calls": len(durations),
+        "min": min(durations)*1000,
+        "p50": statistics.median(durations)*1000,
+        "p90": percentile(durations, 0.9)*1000,
+        "p99": percentile(durations, 0.99)*1000,
+        "max": max(durations)*1000,
+    }
+    if items is not None:
+        result["throughput"] = items/statistics.median(durations)
+    return result
+
+
+def report(label, durations, items=None, unit="items"):
+    """Print the summary of durations, return it."""
+    result = summary(durations, items)
+    line = (f"{label:<40} median {result['p50']:9.2f} ms   min {result['min']:9.2f} ms"
+            f"   p90 {result['p90']:9.2f} ms   p99 {result['p99']:9.2f} ms")
+    if items is not None:
+        line += f"   {result['throughput']:12,.0f} {unit}/s"
+    print(line)
+    return result
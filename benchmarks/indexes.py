@@ -0,0 +1,71 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Query plans and time of each query computing the values, without and
+with the add-on's indexes, see queryPlan.py. Every column is displayed.
+
+Usage: python benchmarks/indexes.py [number of cards] [number of decks]"""
+
+import json
+import os
+import sys
+
+from common import (ADDON_DIR, DB, addonModule, installAnki, makeCollection,
+                    makeMainWindow, measure, report)
+
+
+def main():
+    cards = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    decks = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    conn, deckDicts = makeCollection(cards=cards, decks=decks)
+    with open(os.path.join(ADDON_DIR, "config.json"), encoding="utf-8") as f:
+        config = json.load(f)
+    # Every query is run
+    for column in config["columns"]:
+        column["present"] = True
+    installAnki(makeMainWindow(conn, deckDicts, config))
+    tree = addonModule("tree")
+    queryPlan = addonModule("queryPlan")
+    db = DB(conn)
+    print(f"{cards} cards, {len(deckDicts)} decks")
+
+    def run(label):
+        print(label)
+        texts = tree.queryTexts()
+        if not any(kind == "notes" for kind, _ in texts):
+            texts.append(("notes", tree.NOTES_QUERY))
+        for kind, _, details, found, proposals in queryPlan.diagnose(db, texts):
+            print(f"  {kind}: {' | '.join(details)}")
+            for problem in found:
+                print(f"    {problem}")
+            for name in proposals:
+                print(f"    proposed: {queryPlan.createStatement(name)}")
+        for kind, sql in texts:
+            durations, _ = measure(lambda: db.all(sql), 10)
+            report(f"  {kind}", durations, cards, "cards")
+
+    run("anki's indexes")
+    durations, _ = measure(lambda: queryPlan.createIndexes(db), 1)
+    report("creating the add-on's indexes", durations)
+    # As tree.checkIndexes
+    tree.chunkColumn = "did"
+    run("with the add-on's indexes")
+    queryPlan.dropIndexes(db)
+    assert not queryPlan.existingIndexes(db)
+
+
+if __name__ == "__main__":
+    main()
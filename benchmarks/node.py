@@ -0,0 +1,64 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Time and memory of the construction of every DeckNode of a collection.
+
+Usage: python benchmarks/node.py [number of decks] [number of cards]"""
+
+import sys
+import tracemalloc
+
+from common import (addonModule, deckTree, installAnki, makeCollection,
+                    makeMainWindow, measure, report)
+
+
+def main():
+    decks = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    cards = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+    conn, deckDicts = makeCollection(decks=decks, cards=cards)
+    mw = makeMainWindow(conn, deckDicts)
+    installAnki(mw)
+    node = addonModule("node")
+    tree = addonModule("tree")
+    rollup = addonModule("rollup")
+    root = deckTree(deckDicts)
+    dids, parents, ankiCounts = node.flattenOldNodes(root.children)
+    tree.computeAll({did: dids[parent] if parent >= 0 else None
+                     for did, parent in zip(dids, parents)})
+
+    def build():
+        node.idToNode.clear()
+        node.idToKey.clear()
+        rollup.current = None
+        rollup.compute(tuple(dids), tuple(parents), tuple(ankiCounts))
+        return [node.make(child) for child in root.children]
+
+    print(f"{len(deckDicts)} decks, {cards} cards")
+    durations, _ = measure(build)
+    report("rollup and DeckNode construction", durations)
+    report("per deck", [duration/len(deckDicts) for duration in durations])
+
+    node.idToNode.clear()
+    node.idToKey.clear()
+    tracemalloc.start()
+    nodes = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{'memory per deck':<40} {size/len(deckDicts):9.0f} bytes")
+
+
+if __name__ == "__main__":
+    main()
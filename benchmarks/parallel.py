@@ -0,0 +1,133 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Compare tree.compute on a single connection with the same queries run
+in parallel, each on its own read-only connection to the collection
+file, for several numbers of threads. sqlite releases the GIL while it
+runs a query, so the queries can use several cores.
+
+This is not done by the add-on: anki opens the collection in exclusive
+locking mode, so no other connection can read it while anki runs.
+
+Usage: python benchmarks/parallel.py [number of cards] [number of decks] [repeat]"""
+
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import pathname2url
+
+from common import (ADDON_DIR, DB, addonModule, deckTree, installAnki, makeCollection,
+                    makeMainWindow, measure, report)
+
+
+def readOnly(path):
+    """A DB on a read-only connection to the database at path."""
+    return DB(sqlite3.connect(f"file:{pathname2url(path)}?mode=ro", uri=True, check_same_thread=False))
+
+
+def run(path, tasks, workers):
+    """Call each task with its own read-only DB on the database at path,
+    `workers` tasks at a time. Return their results, in the order of tasks."""
+
+    def call(task):
+        db = readOnly(path)
+        try:
+            return task(db)
+        finally:
+            db.conn.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(call, tasks))
+
+
+def computeInParallel(tree, queries, path, prepared, parents, workers):
+    """Same as tree.compute, with the queries run by run. The scans of
+    cards are split in ranges of card ids and note ids, one per thread."""
+    key, cutoff, counterQueries, notes, limit, (moves, state) = prepared
+    db = readOnly(path)
+    try:
+        ids = queries.idRanges(*db.all("select min(id), max(id) from cards")[0], workers)
+        nids = queries.idRanges(*db.all("select min(nid), max(nid) from cards")[0], workers) if notes else []
+    finally:
+        db.conn.close()
+    repeated = any(query[0] == queries.REPEATED_TODAY for query in counterQueries)
+    cardQueries = [query for query in counterQueries if not query[3]]
+    otherQueries = [query for query in counterQueries if query[3] and query[0] != queries.REPEATED_TODAY]
+    tasks = [lambda db: db.all(tree.LEARNING_QUERY)]
+    if repeated:
+        tasks.append(lambda db: queries.repeatedToday(db, limit, state))
+    tasks.extend((lambda db, query=query: queries.valuesPerQuery(db, [query])) for query in otherQueries)
+    tasks.extend((lambda db, idRange=idRange: queries.valuesSinglePass(db, cardQueries, idRange=idRange))
+                 for idRange in ids)
+    tasks.extend((lambda db, nidRange=nidRange: tree.countNotes(db, parents, nidRange)) for nidRange in nids)
+    results = iter(run(path, tasks, workers))
+    timeRows = next(results)
+    computedValues = {query[0]: dict() for query in counterQueries}
+    if repeated:
+        computedValues[queries.REPEATED_TODAY], state = next(results)
+    for _ in otherQueries:
+        computedValues.update(next(results))
+    for _ in ids:
+        for name, values in next(results).items():
+            tree.addValues(computedValues[name], values)
+    deckCounts, subdeckCounts = dict(), dict()
+    for deckCountsOfRange, subdeckCountsOfRange in results:
+        tree.addValues(deckCounts, deckCountsOfRange)
+        tree.addValues(subdeckCounts, subdeckCountsOfRange)
+    return key, cutoff, counterQueries, computedValues, timeRows, (deckCounts, subdeckCounts), (moves, state)
+
+
+def main():
+    cards = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    decks = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    with open(os.path.join(ADDON_DIR, "config.json"), encoding="utf-8") as f:
+        config = json.load(f)
+    # Every value, including the notes
+    for column in config["columns"]:
+        column["present"] = True
+    config["columns"].append({"name": "notes/cards"})
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "collection.anki2")
+        conn, deckDicts = makeCollection(path, decks=decks, cards=cards)
+        conn.execute("pragma journal_mode = wal")
+        mw = makeMainWindow(conn, deckDicts, config)
+        installAnki(mw)
+        node = addonModule("node")
+        tree = addonModule("tree")
+        queries = addonModule("queries")
+        dids, parents, _ = node.flattenOldNodes(deckTree(deckDicts).children)
+        parentIds = {did: dids[parent] if parent >= 0 else None
+                     for did, parent in zip(dids, parents)}
+        prepared = tree.prepare()
+        print(f"{len(deckDicts)} decks, {cards} cards, {os.cpu_count()} cores")
+
+        durations, expected = measure(lambda: tree.compute(mw.col.db, prepared, parentIds), repeat)
+        report("one query after another", durations, cards, "cards")
+        for workers in (2, 4, 8):
+            durations, computed = measure(
+                lambda: computeInParallel(tree, queries, path, prepared, parentIds, workers), repeat)
+            assert computed[3:6] == expected[3:6], "the parallel queries computed other values"
+            report(f"{workers} threads", durations, cards, "cards")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
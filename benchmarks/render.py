@@ -0,0 +1,67 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Time of the HTML of the deck tree, once the values are computed,
+with every deck expanded and then with top level decks collapsed.
+
+Usage: python benchmarks/render.py [number of decks] [number of cards] [depth]"""
+
+import sys
+
+from common import (addonModule, deckTree, installAnki, makeCollection,
+                    makeMainWindow, measure, report)
+
+
+class Browser:
+    """The part of aqt's DeckBrowser used by renderDeckTree"""
+
+    def _topLevelDragRow(self):
+        return "<tr class='top-level-drag-row'><td colspan='6'>&nbsp;</td></tr>"
+
+
+def main():
+    decks = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    cards = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+    depth = int(sys.argv[3]) if len(sys.argv) > 3 else 6
+    conn, deckDicts = makeCollection(decks=decks, cards=cards, depth=depth)
+    mw = makeMainWindow(conn, deckDicts)
+    installAnki(mw)
+    node = addonModule("node")
+    root = deckTree(deckDicts)
+    browser = Browser()
+    html = node.renderDeckTree(browser, root)
+
+    def build():
+        node.idToNode.clear()
+        node.idToKey.clear()
+        return node.renderDeckTree(browser, root)
+
+    print(f"{len(deckDicts)} decks, {cards} cards, depth {depth}, {len(html)} characters")
+    durations, _ = measure(lambda: node.renderDeckTree(browser, root))
+    report("render, nodes reused", durations)
+    durations, _ = measure(build)
+    report("render, nodes built", durations)
+
+    for child in root.children:
+        deckDicts[child.deck_id]["collapsed"] = True
+    html = build()
+    print(f"top level decks collapsed, {len(html)} characters")
+    durations, _ = measure(build)
+    report("render, nodes built", durations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare the join computing "repeated today" with queries.repeatedToday,
+when everything is read and when only new reviews are read.
+
+Usage: python benchmarks/repeated.py [number of cards] [number of reviews]"""
+
+import sys
+
+from common import (DAY_CUTOFF, DB, TODAY, addonModule, makeCollection,
+                    measure, report)
+
+
+def main():
+    cards = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    reviews = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+    queries = addonModule("queries")
+    conn, _ = makeCollection(cards=cards, reviews=reviews)
+    db = DB(conn)
+    limit = (DAY_CUTOFF - 86400)*1000
+    query = next(query for query in queries.queriesCardCount(0, TODAY, limit)
+                 if query[0] == queries.REPEATED_TODAY)
+    today = conn.execute(f"select count() from revlog where id > {limit}").fetchone()[0]
+    print(f"{cards} cards, {reviews} reviews, {today} of today")
+
+    join, rows = measure(lambda: db.all(queries.groupByQuery(*query[1:])))
+    expected = dict(rows)
+    first, (values, state) = measure(lambda: queries.repeatedToday(db, limit))
+    assert values == expected
+    unchanged, (values, _) = measure(lambda: queries.repeatedToday(db, limit, state))
+    assert values == expected
+    nextId = state.lastId + 1
+    conn.executemany("insert into revlog values (?,?,?,?,?,?,?,?,?)",
+                     [(nextId + i, i + 1, 0, 3, 1, 1, 2500, 1000, 1) for i in range(50)])
+    added, (values, _) = measure(lambda: queries.repeatedToday(db, limit, state))
+    assert values == dict(db.all(queries.groupByQuery(*query[1:])))
+    report("join of revlog and cards", join)
+    report("every review of today", first)
+    report("no new review", unchanged)
+    report("50 new reviews", added)
+
+
+if __name__ == "__main__":
+    main()
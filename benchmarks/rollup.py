@@ -0,0 +1,62 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Time of the subtree rollup, with and without NumPy, and check that
+both give the same values.
+
+Usage: python benchmarks/rollup.py [number of decks] [number of cards] [depth]"""
+
+import sys
+
+from common import (addonModule, deckTree, installAnki, makeCollection,
+                    makeMainWindow, measure, report)
+
+
+def main():
+    decks = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    cards = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+    depth = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    conn, deckDicts = makeCollection(decks=decks, cards=cards, depth=depth)
+    mw = makeMainWindow(conn, deckDicts)
+    installAnki(mw)
+    node = addonModule("node")
+    tree = addonModule("tree")
+    rollup = addonModule("rollup")
+    root = deckTree(deckDicts)
+    dids, parents, ankiCounts = node.flattenOldNodes(root.children)
+    tree.computeAll({did: dids[parent] if parent >= 0 else None
+                     for did, parent in zip(dids, parents)})
+
+    print(f"{len(deckDicts)} decks, {cards} cards, depth {depth}")
+    numpy = rollup.numpy
+    rollup.numpy = None
+    durations, python = measure(lambda: rollup.Rollup(dids, parents, ankiCounts))
+    report("python", durations)
+    if numpy is None:
+        print("NumPy is not installed")
+        return
+    rollup.numpy = numpy
+    durations, vectorized = measure(lambda: rollup.Rollup(dids, parents, ankiCounts))
+    report("numpy", durations)
+    same = all(list(python.deckValues[row]) == vectorized.deckValues[row].tolist()
+               and list(python.subdeckValues[row]) == vectorized.subdeckValues[row].tolist()
+               for row in range(len(dids)))
+    same = same and python.timeDueSubdeck == vectorized.timeDueSubdeck
+    print("same values" if same else "DIFFERENT VALUES")
+
+
+if __name__ == "__main__":
+    main()
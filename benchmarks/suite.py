@@ -0,0 +1,111 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Every step of the deck browser's rendering on a synthetic collection,
+reported as latency percentiles and throughput.
+
+Usage: python benchmarks/suite.py [--decks N] [--depth N] [--cards N]
+    [--notes N] [--reviews N] [--queues 0:3,1:1,2:4] [--repeat N] [--json FILE]
+
+With --json, the results are also written to FILE, so that they can be
+compared across releases."""
+
+import argparse
+import json
+
+from common import (QUEUE_MIX, DB, addonModule, deckTree, installAnki,
+                    makeCollection, makeMainWindow, measure, parseQueueMix,
+                    report)
+from render import Browser
+
+
+def arguments():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--decks", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--cards", type=int, default=100_000)
+    parser.add_argument("--notes", type=int, default=None, help="by default half the cards")
+    parser.add_argument("--reviews", type=int, default=None, help="revlog rows, by default one per card")
+    parser.add_argument("--queues", type=parseQueueMix, default=QUEUE_MIX,
+                        help="weight of each card queue, as queue:weight,...")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="file where the results are written")
+    return parser.parse_args()
+
+
+def main():
+    args = arguments()
+    conn, deckDicts = makeCollection(decks=args.decks, cards=args.cards, depth=args.depth, seed=args.seed,
+                                     notes=args.notes, reviews=args.reviews, queueMix=args.queues)
+    mw = makeMainWindow(conn, deckDicts)
+    installAnki(mw)
+    node = addonModule("node")
+    tree = addonModule("tree")
+    rollup = addonModule("rollup")
+    queries = addonModule("queries")
+    learning = addonModule("learning")
+    db = DB(conn)
+    root = deckTree(deckDicts)
+    browser = Browser()
+    dids, parents, ankiCounts = node.flattenOldNodes(root.children)
+    parentIds = {did: dids[parent] if parent >= 0 else None
+                 for did, parent in zip(dids, parents)}
+    prepared = tree.prepare()
+    counterQueries = prepared[2]
+    decks = len(deckDicts)
+    cards = args.cards
+    print(f"{decks} decks, depth {args.depth}, {cards} cards, "
+          f"{conn.execute('select count(distinct nid) from cards').fetchone()[0]} notes, "
+          f"{conn.execute('select count() from revlog').fetchone()[0]} reviews, "
+          f"{len(counterQueries)} counters, {args.repeat} runs")
+
+    def nodes():
+        node.idToNode.clear()
+        node.idToKey.clear()
+        rollup.current = None
+        rollup.compute(tuple(dids), tuple(parents), tuple(ankiCounts))
+        return [node.make(child) for child in root.children]
+
+    def render():
+        node.idToNode.clear()
+        node.idToKey.clear()
+        return node.renderDeckTree(browser, root)
+
+    steps = [
+        ("counter values", lambda: queries.valuesSinglePass(db, counterQueries), cards, "cards"),
+        ("learning due times", lambda: learning.LearningIndex(db.all(learning.LEARNING_QUERY)).times(), cards, "cards"),
+        ("note counts", lambda: tree.countNotes(db, parentIds), cards, "cards"),
+        ("values, times and notes", lambda: tree.compute(db, prepared, parentIds), cards, "cards"),
+        ("DeckNode construction", nodes, decks, "decks"),
+        ("renderDeckTree, nodes built", render, decks, "decks"),
+        ("renderDeckTree, nodes reused", lambda: node.renderDeckTree(browser, root), decks, "decks"),
+    ]
+    tree.install(tree.compute(db, prepared, parentIds))
+    results = dict()
+    for label, function, items, unit in steps:
+        function()  # Warm up the caches of sqlite and of the add-on
+        durations, _ = measure(function, args.repeat)
+        results[label] = report(label, durations, items, unit)
+
+    if args.json:
+        parameters = {name: value for name, value in vars(args).items() if name != "json"}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parameters": parameters, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Time of the header and tooltip texts of a render, with the
+translation table kept and with the table computed again at each
+translation, as before it was cached.
+
+Usage: python benchmarks/translations.py [language]"""
+
+import sys
+
+from common import (addonModule, installAnki, makeCollection, makeMainWindow,
+                    measure, report)
+
+
+def main():
+    language = sys.argv[1] if len(sys.argv) > 1 else "en"
+    conn, deckDicts = makeCollection(decks=10, cards=100)
+    mw = makeMainWindow(conn, deckDicts)
+    mw.pm.meta["defaultLang"] = language
+    installAnki(mw)
+    config = addonModule("config")
+    strings = addonModule("strings")
+    translations = addonModule("translations")
+    columns = [conf for conf in config.getUserOption("columns") if conf.get("present", True)]
+
+    def texts():
+        return [(strings.getHeader(conf), strings.getOverlay(conf)) for conf in columns]
+
+    def textsWithoutCache():
+        result = []
+        for conf in columns:
+            translations.reset_language()
+            translations.table_key = None
+            header = strings.getHeader(conf)
+            translations.reset_language()
+            translations.table_key = None
+            result.append((header, strings.getOverlay(conf)))
+        return result
+
+    print(f"language {translations.current_language()}, {len(columns)} columns")
+    durations, cached = measure(texts, repeat=100)
+    report("headers and tooltips, cached", durations)
+    durations, uncached = measure(textsWithoutCache, repeat=100)
+    report("headers and tooltips, not cached", durations)
+    print("same texts" if cached == uncached else "DIFFERENT TEXTS")
+
+
+if __name__ == "__main__":
+    main()
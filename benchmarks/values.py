@@ -0,0 +1,50 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare one group by query per counter with the single pass aggregation.
+
+Usage: python benchmarks/values.py [number of cards] [number of decks]"""
+
+import sys
+
+from common import (DAY_CUTOFF, NOW, TODAY, DB, addonModule, makeCollection,
+                    measure, report)
+
+
+def main():
+    cards = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    decks = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    queries = addonModule("queries")
+    conn, _ = makeCollection(cards=cards, decks=decks)
+    db = DB(conn)
+    counters = queries.queriesCardCount(
+        NOW + 1200, TODAY, (DAY_CUTOFF - 86400)*1000)
+
+    print(f"{cards} cards, {decks} decks, {len(counters)} counters")
+    perQuery, expected = measure(lambda: queries.valuesPerQuery(db, counters))
+    singlePass, actual = measure(lambda: queries.valuesSinglePass(db, counters))
+    report("one query per counter", perQuery)
+    report("single pass", singlePass)
+    for name in expected:
+        for did in set(expected[name]) | set(actual[name]):
+            if expected[name].get(did, 0) != actual[name].get(did, 0):
+                print(f"Mismatch for {name} in deck {did}: "
+                      f"{expected[name].get(did, 0)} != {actual[name].get(did, 0)}")
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -24,8 +24,12 @@ from aqt.deckbrowser import DeckBrowser
 from aqt import mw
 from aqt import gui_hooks
 
+from . import translations, tree
 from .column import _linkHandler
+from .config import flushConfig
+from .htmlAndCss import css_file, js_file, web_export_url
 from .node import idToNode, renderDeckTree
+from .partialUpdate import renderPage
 
 
 # based on Anki 2.0.36 aqt/deckbrowser.py DeckBrowser._deckRow
@@ -65,6 +69,17 @@ def apply_deck_tree_patch():
 def on_profile_loaded():
     """Aplica patch quando o perfil do Anki é carregado"""
     apply_deck_tree_patch()
+    # The new profile may use another language
+    translations.reset_language()
+    tree.forgetRepeated()
+    tree.checkIndexes()
+    tree.loadSnapshot()
+
+
+def on_profile_will_close():
+    tree.saveSnapshot()
+    # A column moved just before closing
+    flushConfig()
 
 
 # Aplica o patch imediatamente se já tiver coleção carregada
@@ -72,8 +87,56 @@ apply_deck_tree_patch()
 
 # Também aplica via hook para garantir que funcione em todas as situações
 gui_hooks.profile_did_open.append(on_profile_loaded)
+# The counters are saved to be displayed at once when the profile is opened again
+gui_hooks.profile_will_close.append(on_profile_will_close)
+
+
+def on_reviewer_will_answer_card(ease_tuple, reviewer, card):
+    tree.beforeAnswer(card)
+    return ease_tuple
+
+
+def on_reviewer_did_answer_card(reviewer, card, ease):
+    tree.afterAnswer(card)
+
+
+def on_operation_did_execute(changes, handler):
+    tree.onOperationDidExecute(changes, handler)
+
+
+def on_sync_did_finish():
+    # Cards may have changed deck on another device
+    tree.forgetRepeated()
+
+
+# Update the counters after each review instead of computing them again
+gui_hooks.reviewer_will_answer_card.append(on_reviewer_will_answer_card)
+gui_hooks.reviewer_did_answer_card.append(on_reviewer_did_answer_card)
+gui_hooks.operation_did_execute.append(on_operation_did_execute)
+gui_hooks.sync_did_finish.append(on_sync_did_finish)
+
+
+# The deck browser loads the add-on's script and style from the add-on's
+# folder. They are cached by the webview until their content changes.
+mw.addonManager.setWebExports(__name__, r"(deckbrowser\.js|defaultcss\.css)$")
+addon_folder = mw.addonManager.addonFromModule(__name__)
+js_url = web_export_url(addon_folder, js_file)
+css_url = web_export_url(addon_folder, css_file)
+
+
+def on_webview_will_set_content(web_content, context):
+    if isinstance(context, DeckBrowser):
+        # Instead of anki's deckbrowser.js, whose init makes every row
+        # draggable when the page is loaded
+        web_content.js = [js for js in web_content.js if js != "js/deckbrowser.js"]
+        web_content.js.append(js_url)
+        web_content.css.append(css_url)
+
+
+gui_hooks.webview_will_set_content.append(on_webview_will_set_content)
 
 
 DeckBrowser._deckRow = deckRow
 DeckBrowser._renderDeckTree = renderDeckTree
+DeckBrowser._renderPage = renderPage
 DeckBrowser._linkHandler = _linkHandler
@@ -23,7 +23,9 @@ from aqt.deckbrowser import DeckBrowser
 from aqt.qt import *
 from aqt.utils import askUser
 
-from .config import getUserOption, writeConfig
+from .config import getUserOption, writeConfigLater
+from .partialUpdate import onRefreshTimer, reorderColumns
+from .strings import columnPlan
 
 
 
@@ -32,6 +34,9 @@ lastHandler = DeckBrowser._linkHandler
 
 def _linkHandler(self, url):
     # print(f"DEBUG _linkHandler url: {url}")
+    if url == "learningDue":
+        # Sent by deckbrowser.js when a card in learning is due
+        return onRefreshTimer()
     if ":" in url:
         (cmd, arg) = url.split(":", 1)
         if cmd == "dragColumn":
@@ -40,13 +45,18 @@ def _linkHandler(self, url):
 
 
 def columnHandler(self, arg):
+    """The columns were already reordered by moveColumn in deckbrowser.js. Save the new order."""
     draggedDeckId, ontoDeckId = arg.split(",")
     draggedDeckId = int(draggedDeckId)
     ontoDeckId = int(ontoDeckId)
     columns = getUserOption("columns")
+    before = [columns[spec.colpos] for spec in columnPlan()]
     columns.insert(draggedDeckId, columns.pop(ontoDeckId))
-    writeConfig()
-    self.show()
+    writeConfigLater()
+    after = [columns[spec.colpos] for spec in columnPlan()]
+    order = [next(index for index, conf in enumerate(before) if conf is moved) for moved in after]
+    if not reorderColumns(order):
+        self.show()
 
 
 
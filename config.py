@@ -19,12 +19,16 @@ import sys
 from aqt import mw
 
 userOption = None
+# Incremented at each change of the configuration
+version = 0
 
 
 def getUserOption(key=None, default=None):
     global userOption
     if userOption is None:
         userOption = mw.addonManager.getConfig(__name__)
+        if migrate(userOption):
+            writeConfig()
     if key is None:
         return userOption
     if key in userOption:
@@ -35,14 +39,62 @@ def getUserOption(key=None, default=None):
         return default
 
 
+def migrate(conf):
+    """Update a configuration of an older version of the add-on. Return whether it changed."""
+    changed = False
+    for column in conf.get("columns", []):
+        if column.get("name") == "new":
+            # It used to be called "new".
+            column["name"] = "new today"
+            changed = True
+    return changed
+
+
 def writeConfig():
+    global version, pendingWrite
+    version += 1
+    pendingWrite = False
     mw.addonManager.writeConfig(__name__, userOption)
 
 
+# Number of calls to writeConfigLater. Only the last one writes.
+laterWrites = 0
+# Whether a change of writeConfigLater is not written yet
+pendingWrite = False
+
+
+def writeConfigLater(delay=1000):
+    """Take the change of the configuration into account now, and
+    write it once no other change happened during delay milliseconds."""
+    global version, laterWrites, pendingWrite
+    version += 1
+    laterWrites += 1
+    pendingWrite = True
+    call = laterWrites
+
+    def write():
+        if call == laterWrites:
+            flushConfig()
+    # Written even if the collection is closed meanwhile
+    mw.progress.timer(delay, write, False, requiresCollection=False)
+
+
+def flushConfig():
+    """Write the change of writeConfigLater now, if it is not written yet."""
+    if pendingWrite and userOption is not None:
+        writeConfig()
+
+
 def update(_):
-    global userOption, fromName
+    global userOption, fromName, version
     userOption = None
     fromName = None
+    version += 1
+
+
+def getVersion():
+    """A number which changes each time the configuration changes."""
+    return version
 
 
 mw.addonManager.setConfigUpdatedAction(__name__, update)
@@ -55,5 +107,6 @@ def getFromName(name):
     if fromName is None:
         fromName = dict()
         for dic in getUserOption("columns"):
-            fromName[dic["name"]] = dic
+            # The first column with this name, if there are several
+            fromName.setdefault(dic["name"], dic)
     return fromName.get(name)
@@ -2,44 +2,91 @@
  * License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html */
 
 
-function init() {
-
+/* This file replaces anki's deckbrowser.js, see
+ * changeFunction.on_webview_will_set_content.
+ *
+ * Rows and headers are made draggable only when a mouse button is
+ * pressed on one of them, see startDrag, and droppable only when a drag
+ * starts, so that displaying the page does not depend on the number of
+ * decks. */
+var DRAGGABLE = {
+    scroll: false,
 
-    $("tr.deck").draggable({
-        scroll: false,
+    // Called by jQuery UI before it computes the position of the droppables
+    start: function (event, ui) {
+        if ($(this).is("th.count")) {
+            initDroppables($("th.count"), columnDropEvent);
+        } else {
+            initDroppables($("tr.deck, tr.top-level-drag-row"), handleDropEvent);
+        }
+    },
 
-        // can't use "helper: 'clone'" because of a bug in jQuery 1.5
-        helper: function (event) {
-            return $(this).clone(false);
-        },
-        delay: 200,
-        opacity: 0.7
-    });
-    $("th.count").draggable({
-        scroll: false,
+    // can't use "helper: 'clone'" because of a bug in jQuery 1.5
+    helper: function (event) {
+        return $(this).clone(false);
+    },
+    delay: 200,
+    opacity: 0.7
+};
 
-        // can't use "helper: 'clone'" because of a bug in jQuery 1.5
-        helper: function (event) {
-            return $(this).clone(false);
-        },
-        delay: 200,
-        opacity: 0.7
+/* Make the elements of targets droppable, unless they already are. */
+function initDroppables(targets, drop) {
+    targets = targets.filter(function () {
+        return !this.dropInitialized;
     });
-    $("tr.deck").droppable({
-        drop: handleDropEvent,
-        hoverClass: 'drag-hover'
+    targets.each(function () {
+        this.dropInitialized = true;
     });
-    $("th.count").droppable({
-        drop: columnDropEvent,
-        hoverClass: 'drag-hover'
-    });
-    $("tr.top-level-drag-row").droppable({
-        drop: handleDropEvent,
+    targets.droppable({
+        drop: drop,
         hoverClass: 'drag-hover'
     });
 }
+
+/* Called when a mouse button is pressed on a row or a header. The first
+ * time, the element is made draggable and the event is sent again to it
+ * so that the drag starts. */
+function startDrag(event) {
+    if (!this.dragInitialized) {
+        this.dragInitialized = true;
+        $(this).draggable(DRAGGABLE).trigger(event);
+    }
+}
+
+function init() {
+    // The deck header is the first cell of the deck table, see node.renderDeckTree
+    $("th").first().closest("table").on("mousedown", "tr.deck, th.count", startDrag);
+    if (!window.learningDueTimer) {
+        window.learningDueTimer = setInterval(countDown, 1000);
+    }
+    $(window).on("scroll resize", scheduleVirtualRows);
+}
 $(init);
 
+/* The time, in seconds, at which the numbers were last asked to be
+ * computed again because a card in learning became due. */
+var learningDueRequest = 0;
+
+/* Update the time before the next card in learning of each deck, as
+ * node.DeckNode.textTime does. Once a card is counted as due now, ask
+ * for the numbers to be computed again, at most every 5 seconds. */
+function countDown() {
+    // In whole seconds, as anki.utils.int_time
+    var now = Math.floor(Date.now() / 1000);
+    var refresh = false;
+    $("span.learning-due").each(function () {
+        var remaining = parseInt(this.getAttribute("data-due")) - now;
+        if (now >= parseInt(this.getAttribute("data-refresh"))) {
+            refresh = true;
+        }
+        this.textContent = remaining >= 60 ? "[" + Math.floor(remaining / 60) + "m]" : "[" + Math.max(remaining, 0) + "s]";
+    });
+    if (refresh && now - learningDueRequest >= 5) {
+        learningDueRequest = now;
+        pycmd("learningDue");
+    }
+}
+
 function handleDropEvent(event, ui) {
     var draggedDeckId = ui.draggable.attr('id');
     var ontoDeckId = $(this).attr('id') || '';
@@ -48,7 +95,205 @@ function handleDropEvent(event, ui) {
 }
 
 function columnDropEvent(event, ui) {
-    var draggedDeckId = ui.draggable.attr('colpos');
-    var ontoDeckId = $(this).attr('colpos') || '';
-    pycmd("dragColumn:" + draggedDeckId + "," + ontoDeckId);
+    var dragged = parseInt(ui.draggable.attr('colpos'));
+    var onto = parseInt($(this).attr('colpos'));
+    if (isNaN(dragged) || isNaN(onto)) {
+        return;
+    }
+    moveColumn(dragged, onto);
+    pycmd("dragColumn:" + dragged + "," + onto);
+}
+
+/* Move the column at position onto of the configuration to position
+ * dragged, as column.columnHandler does in the configuration. The
+ * headers and the cells are reordered in place. */
+function moveColumn(dragged, onto) {
+    var headers = $("th.count").get();
+    var oldPositions = headers.map(function (header) {
+        return parseInt(header.getAttribute("colpos"));
+    });
+    var size = Math.max(dragged, onto, Math.max.apply(null, oldPositions)) + 1;
+    var positions = [];
+    for (var i = 0; i < size; i++) {
+        positions.push(i);
+    }
+    positions.splice(dragged, 0, positions.splice(onto, 1)[0]);
+    var newPositions = oldPositions.map(function (position) {
+        return positions.indexOf(position);
+    });
+    var order = oldPositions.map(function (_, index) {
+        return index;
+    }).sort(function (first, second) {
+        return newPositions[first] - newPositions[second];
+    });
+    headers.forEach(function (header, index) {
+        header.setAttribute("colpos", newPositions[index]);
+    });
+    reorder(headers, order);
+    $("tr.deck").each(function () {
+        reorder($(this).children("td.number_cell").get(), order);
+    });
+}
+
+/* Put the sibling elements in the order of the indexes in order, where
+ * the last one was. */
+function reorder(elements, order) {
+    if (!elements.length) {
+        return;
+    }
+    var parent = elements[0].parentNode;
+    var anchor = elements[elements.length - 1].nextSibling;
+    order.forEach(function (index) {
+        parent.insertBefore(elements[index], anchor);
+    });
+}
+
+function patchHeaders(changes) {
+    var headers = $("th.count");
+    $.each(changes, function (position, html) {
+        var header = $(html.trim());
+        headers.eq(position).replaceWith(header);
+    });
+}
+
+/* Apply the changes sent by partialUpdate.py. */
+function patchDeckBrowser(changes) {
+    patchHeaders(changes.headers);
+    $.each(changes.remove, function (_, did) {
+        $(document.getElementById(did)).remove();
+    });
+    $.each(changes.rows, function (_, change) {
+        var did = change[0], previous = change[1], row = $(change[2].trim());
+        var old = document.getElementById(did);
+        if (old) {
+            $(old).replaceWith(row);
+        } else if (previous === null) {
+            $("tr.top-level-drag-row").first().after(row);
+        } else {
+            $(document.getElementById(previous)).after(row);
+        }
+    });
+    $.each(changes.cells, function (did, cells) {
+        var numberCells = $(document.getElementById(did)).children("td.number_cell");
+        $.each(cells, function (position, html) {
+            numberCells.eq(position).replaceWith(html.trim());
+        });
+    });
+}
+
+/* When the table has too many rows, see node.isVirtual, the rows are
+ * kept here and only the ones in the viewport, and a margin around, are
+ * in the page, between the rows #virtual-top and #virtual-bottom whose
+ * heights stand for the other rows.
+ *
+ * dids -- the deck id of each row
+ * fragments -- the distinct parts of the rows
+ * rows -- each row, as the HTML of the row or the indexes of its fragments
+ * height -- the height of a row, measured once rows are displayed
+ * first/last -- the rows in the page are rows[first:last] */
+var virtual = null;
+var VIRTUAL_MARGIN = 20;
+// The height of a row until it is measured
+var VIRTUAL_ROW_HEIGHT = 20;
+
+function virtualRows(dids, fragments, rows) {
+    virtual = {dids: dids, fragments: fragments, rows: rows, height: 0, first: 0, last: 0};
+    $(function () {
+        renderVirtualRows(true);
+    });
+}
+
+/* The columns were reordered, see partialUpdate.reorderColumns. */
+function setVirtualRows(fragments, rows) {
+    virtual.fragments = fragments;
+    virtual.rows = rows;
+    renderVirtualRows(true);
+}
+
+function virtualRowHtml(row) {
+    if (typeof row === "string") {
+        return row;
+    }
+    return row.map(function (index) {
+        return virtual.fragments[index];
+    }).join("");
+}
+
+var virtualRowsScheduled = false;
+
+function scheduleVirtualRows() {
+    if (!virtual || virtualRowsScheduled) {
+        return;
+    }
+    virtualRowsScheduled = true;
+    requestAnimationFrame(function () {
+        virtualRowsScheduled = false;
+        renderVirtualRows(false);
+    });
+}
+
+/* Put in the page the rows in the viewport. Unless force, nothing is
+ * done if they are already there. */
+function renderVirtualRows(force) {
+    var top = $("#virtual-top");
+    var bottom = $("#virtual-bottom");
+    if (!virtual || !top.length) {
+        return;
+    }
+    var height = virtual.height || VIRTUAL_ROW_HEIGHT;
+    var offset = $(window).scrollTop() - top.offset().top;
+    var first = Math.max(0, Math.floor(offset / height) - VIRTUAL_MARGIN);
+    var last = Math.min(virtual.rows.length, Math.ceil((offset + $(window).height()) / height) + VIRTUAL_MARGIN);
+    first = Math.min(first, last);
+    if (!force && first === virtual.first && last === virtual.last) {
+        return;
+    }
+    virtual.first = first;
+    virtual.last = last;
+    top.nextUntil(bottom).remove();
+    var rows = $(virtual.rows.slice(first, last).map(virtualRowHtml).join("").trim());
+    top.after(rows);
+    if (!virtual.height && last > first) {
+        // 0 while the page is not laid out; measured again at the next call
+        var measured = (bottom.offset().top - top.offset().top) / (last - first);
+        if (measured > 0) {
+            virtual.height = measured;
+            renderVirtualRows(true);
+            return;
+        }
+    }
+    top.children("td").height(first * height);
+    bottom.children("td").height((virtual.rows.length - last) * height);
+}
+
+/* Same as patchDeckBrowser, for the rows kept in virtual. Each row of
+ * changes.rows replaces the row of the same deck, or is inserted after
+ * the row of the previous deck. */
+function patchVirtualRows(changes) {
+    patchHeaders(changes.headers);
+    var removed = {};
+    $.each(changes.remove, function (_, did) {
+        removed[did] = true;
+    });
+    var dids = [], rows = [];
+    virtual.dids.forEach(function (did, index) {
+        if (!removed[did]) {
+            dids.push(did);
+            rows.push(virtual.rows[index]);
+        }
+    });
+    changes.rows.forEach(function (change) {
+        var did = change[0], previous = change[1], row = change[2];
+        var index = dids.indexOf(did);
+        if (index < 0) {
+            index = previous === null ? 0 : dids.indexOf(previous) + 1;
+            dids.splice(index, 0, did);
+            rows.splice(index, 0, row);
+        } else {
+            rows[index] = row;
+        }
+    });
+    virtual.dids = dids;
+    virtual.rows = rows;
+    renderVirtualRows(true);
 }
@@ -0,0 +1,114 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Which values must be computed to display the columns of the configuration."""
+
+from .config import getUserOption, getVersion
+from .queries import COUNTER_NAMES
+
+# Values computed by anki, see rollup.Rollup
+ANKI_VALUES = ("review today", "new today", "repetition of today learning")
+
+# (name, first, second, negate): the value of name is first + second,
+# or first - second if negate. In order of computation, see
+# rollup.Rollup
+SUMS = [
+    ("learning now", "learning now from today", "learning today from past", False),
+    ("learning later", "learning later today", "learning future", False),
+    ("learning card", "learning now", "learning later", False),
+    ("learning today", "learning later today", "learning now", False),
+    # Repetition
+    ("learning today repetition", "learning today repetition from today", "learning today repetition from past", False),
+    ("learning repetition", "learning repetition from today", "learning repetition from past", False),
+    ("learning future repetition", "learning repetition", "learning today repetition", True),
+    # Review
+    ("review later", "review due", "review today", True),
+    ("unseen later", "unseen", "new today", True),
+    ("repetition seen today", "repetition of today learning", "review today", False),
+    ("repetition today", "repetition seen today", "new today", False),
+    ("cards seen today", "learning today", "review today", False),
+    ("today", "cards seen today", "new today", False),
+]
+
+# Every number known about a deck. Its position is the index of the
+# value in DeckNode's arrays.
+VALUE_NAMES = COUNTER_NAMES + ANKI_VALUES + ("notes",) + tuple(name for name, _, _, _ in SUMS)
+VALUE_INDEX = {name: index for index, name in enumerate(VALUE_NAMES)}
+
+# Texts showing two values as "first/second", see DeckNode.text
+PAIRS = {f"{first}/{second}": (first, second) for first, second in [
+    ("mature", "young"), ("notes", "cards"), ("buried", "suspended"), ("reviewed today", "repeated today")]}
+# Texts showing the values to see now, and in parenthesis the values to see later
+NOW_LATERS = {
+    "review": ("review today", "review later"),
+    "unseen new": ("new today", "unseen later"),
+    "learning today": ("learning now", "learning later today"),
+}
+LEARNING_ALL = ("learning now", "learning later today", "learning future")
+
+# Every name a column can display
+COLUMN_NAMES = set(VALUE_NAMES) | set(PAIRS) | set(NOW_LATERS) | {"learning all"}
+
+# Associate to each value or text computed from other values the values
+# it is computed from. Other values are either computed in the database
+# (see queries.py), by anki or from notes.
+DEPENDENCIES = {name: (first, second) for name, first, second, _ in SUMS}
+DEPENDENCIES.update(PAIRS)
+DEPENDENCIES.update(NOW_LATERS)
+DEPENDENCIES["learning all"] = LEARNING_ALL
+
+
+def closure(names):
+    """The names, and every values they depend on."""
+    result = set()
+    toVisit = list(names)
+    while toVisit:
+        name = toVisit.pop()
+        if name in result:
+            continue
+        result.add(name)
+        toVisit.extend(DEPENDENCIES.get(name, ()))
+    return result
+
+
+def columnNames(conf):
+    """The names of the values displayed by a column"""
+    if conf["name"] == "bar":
+        return conf.get("names", [])
+    return [conf["name"]]
+
+
+def computeNeeded():
+    """The set of values to compute."""
+    names = {"cards"}  # Used to decide whether the default deck is hidden, and in percents
+    for conf in getUserOption("columns"):
+        if conf.get("present", True):
+            names.update(columnNames(conf))
+    return frozenset(closure(names))
+
+
+# The result of computeNeeded, and the configuration version for which it was computed
+needed = None
+neededVersion = None
+
+
+def neededValues():
+    """The set of values needed to display the columns."""
+    global needed, neededVersion
+    if needed is None or neededVersion != getVersion():
+        needed = computeNeeded()
+        neededVersion = getVersion()
+    return needed
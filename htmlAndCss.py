@@ -14,6 +14,8 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
+import json
 import os
 
 # from anki.lang import _
@@ -28,10 +30,18 @@ __location__ = os.path.realpath(
 js_file = os.path.join(__location__, "deckbrowser.js")
 css_file = os.path.join(__location__, "defaultcss.css")
 
-with open(js_file, "r", encoding="utf-8") as f:
-    js = f.read()
-with open(css_file, "r", encoding="utf-8") as f:
-    css = f.read()
+
+
+def content_version(path):
+    """A hash of the file's content. Added to the file's URL, so that the
+    webview caches the file until it changes."""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+
+def web_export_url(addon_folder, path):
+    """The URL of a file of the add-on exported to the webviews, see changeFunction.py"""
+    return f"/_addons/{addon_folder}/{os.path.basename(path)}?v={content_version(path)}"
 
 
 ######################
@@ -93,18 +103,27 @@ def deck_name(depth, collapse, extraclass, did, cssStyle, name):
 """
 
 
-def number_cell(colour, number, description):
+def number_cell_template(description):
+    """The parts of a number cell around the colour and the number, which
+    depend only on the column."""
     title_attr = f"title='{description}'" if description else ""
     class_attribute = "number_cell"
-    t = f"""
-    <td align='right' class='{class_attribute}' {title_attr}>"""
-    t += f"""
-      <font color='{colour}'>
-        {number}
-      </font>"""
-    t += """
+    start = f"""
+    <td align='right' class='{class_attribute}' {title_attr}>
+      <font color='"""
+    middle = """'>
+        """
+    return start, middle
+
+
+number_cell_end = """
+      </font>
     </td>"""
-    return t
+
+
+def learning_due(text, due, refresh):
+    """The time before the next card in learning, counted down by deckbrowser.js until refresh."""
+    return f"<span class='learning-due' data-due='{int(due)}' data-refresh='{int(refresh)}'>{text}</span>"
 
 
 def gear(did):
@@ -127,6 +146,16 @@ end_line = """
   </tr>"""
 
 
+def virtual_rows(dids, fragments, rows):
+    """Empty rows standing for the rows above and below the viewport, and
+    the script giving the rows to virtualRows in deckbrowser.js, see node.virtualTable"""
+    data = f"{json.dumps(dids)}, {json.dumps(fragments)}, {json.dumps(rows)}".replace("</", "<\\/")
+    return f"""
+  <tr class = 'virtual-spacer' id = 'virtual-top'><td></td></tr>
+  <tr class = 'virtual-spacer' id = 'virtual-bottom'><td></td></tr>
+  <script>virtualRows({data});</script>"""
+
+
 def bar(name, width, left, color, overlay):
     title_attr = f"title='{overlay}'" if overlay else ""
     return f"""
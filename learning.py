@@ -0,0 +1,97 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""The due times of the cards in learning, by deck.
+
+The first due time of a deck is displayed instead of its number of
+cards in learning when none is due now. The index is built from the
+cards in learning once, and after a review only the cards of the
+reviewed note are read again. This module does not depend on anki."""
+
+import heapq
+
+from .consts import QUEUE_LRN, QUEUE_PREVIEW
+
+# The rows (id, did, due, queue) of the cards in learning
+LEARNING_QUERY = f"select id, did, due, queue from cards where queue in ({QUEUE_LRN}, {QUEUE_PREVIEW})"
+
+
+def noteQuery(nid):
+    """The rows (id, did, due, queue) of every card of the note, in learning or not."""
+    return f"select id, did, due, queue from cards where nid = {int(nid)}"
+
+
+class LearningIndex:
+    """The cards in learning, indexed by deck.
+
+    cards -- associate to the id of each card in learning its (did, due, queue)
+    heaps -- associate to deck ids a heap of the (due, cid) of their cards
+    in queue QUEUE_LRN. Entries of cards which changed since are removed
+    once they reach the top of the heap.
+    """
+    __slots__ = ("cards", "heaps")
+
+    def __init__(self, rows=()):
+        """rows -- the result of LEARNING_QUERY"""
+        self.cards = dict()
+        self.heaps = dict()
+        for cid, did, due, queue in rows:
+            self.cards[cid] = (did, due, queue)
+            if queue == QUEUE_LRN:
+                self.heaps.setdefault(did, []).append((due, cid))
+        for heap in self.heaps.values():
+            heapq.heapify(heap)
+
+    def update(self, rows):
+        """Take into account the new state (id, did, due, queue) of some
+        cards. Return the decks whose first due time may have changed."""
+        changed = set()
+        for cid, did, due, queue in rows:
+            old = self.cards.pop(cid, None)
+            if old is not None:
+                changed.add(old[0])
+            if queue in (QUEUE_LRN, QUEUE_PREVIEW):
+                self.cards[cid] = (did, due, queue)
+                if queue == QUEUE_LRN:
+                    heapq.heappush(self.heaps.setdefault(did, []), (due, cid))
+                changed.add(did)
+        return changed
+
+    def firstDue(self, did):
+        """The first due time of the cards of deck did in queue QUEUE_LRN, or None."""
+        heap = self.heaps.get(did)
+        while heap:
+            due, cid = heap[0]
+            if self.cards.get(cid) == (did, due, QUEUE_LRN):
+                return due
+            heapq.heappop(heap)
+        self.heaps.pop(did, None)
+        return None
+
+    def times(self, dids=None):
+        """Associate to the decks dids (by default, every deck with cards in
+        QUEUE_LRN) their first due time, or None."""
+        if dids is None:
+            dids = list(self.heaps)
+        return {did: self.firstDue(did) for did in dids}
+
+    def rows(self):
+        """The rows (id, did, due, queue) of the cards in learning, as LEARNING_QUERY."""
+        return [(cid, did, due, queue) for cid, (did, due, queue) in self.cards.items()]
+
+    def nextDue(self, limit):
+        """The first due time after limit of a card in learning, or None."""
+        return min((due for _, due, _ in self.cards.values() if due > limit), default=None)
@@ -14,30 +14,26 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import copy
-import sys
-import time
-
-# from anki.utils import ids2str, intTime
-from anki.utils import ids2str, int_time
+from anki.utils import int_time
 from aqt import mw
 from aqt.qt import *
-from aqt.utils import downArrow
 
-from . import tree
-from .config import getFromName, getUserOption, writeConfig
+from . import profiling, rollup, tree
+from .config import getUserOption, getVersion
+from .dependencies import NOW_LATERS, PAIRS, VALUE_INDEX
 from .htmlAndCss import (bar, collapse_children_html, collapse_no_child,
-                         column_header, css, deck_header, deck_name,
-                         deck_option_name, end_header, end_line, gear, js,
-                         number_cell, option_header, 
-                         progress, start_header, start_line, option_name_header_html)
+                         column_header, deck_header, deck_name,
+                         deck_option_name, end_header, end_line, gear, learning_due,
+                         number_cell_end, option_header,
+                         progress, start_header, start_line, option_name_header_html, virtual_rows)
 from .printing import conditionString, nowLater
-from .strings import getColor, getHeader, getOverlay, tr
+from .strings import columnPlan, tr
 
 
 # Dict from deck id to deck node
 idToNode = dict()
-idToOldNode = dict()
+# Dict from deck id to the cacheKey of the deck node
+idToKey = dict()
 
 
 def idFromOldNode(node):
@@ -49,8 +45,39 @@ def idFromOldNode(node):
         return node.deck_id
 
 
-# The list of column in configuration which does not exists, and such that the user was already warned about it.
-warned = set()
+def childrenFromOldNode(node):
+    # Look at aqt/deckbrowser.py for a description of node
+    try:
+        (_, _, _, _, _, children) = node
+        return children
+    except:
+        return node.children
+
+
+def collapsedFromOldNode(node, deck):
+    """Whether the deck is collapsed in the deck browser. Read in the
+    tree when it has this information, otherwise in the deck"""
+    try:
+        return node.collapsed
+    except AttributeError:
+        return deck['collapsed']
+
+
+def flattenOldNodes(nodes, parent=-1, flat=None):
+    """The deck ids of the old trees in pre-order, the row of their
+    parent (-1 for top level decks), and the numbers anki computed for
+    them, in the order of ANKI_VALUES. See rollup.py"""
+    if flat is None:
+        flat = ([], [], [])
+    dids, parents, ankiCounts = flat
+    for node in nodes:
+        row = len(dids)
+        dids.append(idFromOldNode(node))
+        parents.append(parent)
+        _, rev, lrn, new = countsFromOldNode(node)
+        ankiCounts.append((rev, new, lrn))
+        flattenOldNodes(childrenFromOldNode(node), row, flat)
+    return flat
 
 
 class DeckNode:
@@ -61,16 +88,16 @@ class DeckNode:
     dueRevCards -- number of review to see today
     dueLrnReps -- numbers of cards in learning
     newCards -- number of new cards to see today
-    children -- the set of children, as decknode
+    children -- the set of children, as decknode. Empty if the deck is collapsed, since they are not displayed
+    hasChildren -- whether the deck has subdecks, displayed or not
+    collapsed -- whether the deck is collapsed in the deck browser
     deck -- the deck objects
 
     Information to potentially display
-    count -- associate to [absolute/percent][deck/subdeck][isThisAString][value] the number/percent of cards satisfying value in the deck (and its subdeck)
-    set -- associate to [deck/subdeck][value] the set of nids satisfying "value" in the deck (and its subdeck)
-    markedNotesRec -- the set of marked notes in the deck and its subdkc
-    endedMarkedDescendant -- whether the deck has a descendant ended with marked cards
-    timeDue[deck/subdeck] -- the number of seconds before the first card in learning will be seen
-    isEmpty -- whether deck and subdecks has no unseen cards
+    deckValues -- the row of the numbers of cards satisfying each value in the deck, indexed as VALUE_NAMES, see rollup.py
+    subdeckValues -- the same for the deck and its subdecks
+    timeDueDeck/timeDueSubdeck -- the time at which the first card in learning will be seen
+    Texts to display are computed when the row is printed, see text.
 
     Conf parameters
     isFiltered -- whether this is a filtered deck
@@ -92,14 +119,21 @@ class DeckNode:
     givenUp
     """
 
-    def __init__(self, mw, oldNode, endedParent=False, givenUpParent=False, pauseParent=False):
+    __slots__ = (
+        "mw", "endedParent", "pauseParent", "givenUpParent",
+        "name", "did", "dueRevCards", "dueLrnReps", "newCardsToday", "oldChildren",
+        "deck", "deckValues", "subdeckValues", "timeDueDeck", "timeDueSubdeck",
+        "children", "hasChildren", "collapsed", "isFiltered", "confName",
+        "containsEndSymbol", "containsPauseSymbol", "containsBookSymbol", "containsGivenUpSymbol",
+        "ended", "givenUp", "pause",
+    )
+
+    def __init__(self, mw, oldNode, endedParent=False, givenUpParent=False, pauseParent=False, children=None):
         # Look at aqt/deckbrowser.py for a description of oldNode
-        "Build the new deck tree or subtree (with extra info) by traversing the old one."
+        """Build the new deck tree or subtree (with extra info) by traversing the old one.
+
+        children -- the nodes of the children, if already made by make."""
 
-        # Associate each of the potentially interesting parameters of this node
-        self.param = dict()
-        # CSS Style
-        self.style = dict()
         self.mw = mw
         self.endedParent = endedParent
         self.pauseParent = pauseParent
@@ -109,32 +143,18 @@ class DeckNode:
         except:
             self.name = oldNode.name; self.did = oldNode.deck_id; self.dueRevCards = oldNode.review_count; self.dueLrnReps = oldNode.learn_count; self.newCardsToday = oldNode.new_count; self.oldChildren = oldNode.children;
         self.deck = mw.col.decks.get(self.did)
+        self.collapsed = collapsedFromOldNode(oldNode, self.deck)
+        self.hasChildren = bool(self.oldChildren)
 
-        self.initDicts()
         self.setSymbolsParameters()
-        self.setChildren()
+        self.setChildren(children)
         self.setDeckLevel()
-        self.setSubdeck()
-
-        self.fromSetToCount()
-        self.setText()
 
     def setDeckLevel(self):
         """Compute every informations which does not need access to
         children """
         self.setConfParameters()
-        self.initCountFromDb()  # count information of card from database
-        self.initNid()  # set of note from database
-        self.initTimeDue()
-        self.initFromAlreadyComputed()
-        self.initCountSum()  # basic sum from database information
-
-    def setSubdeck(self):
-        self.setSubdeckCount()  # Sum of subdecks value
-        self.setSubdeckSets()  # Union of subdecks set
-        self.setTimeDue()
-        self.setEmpty()
-        self.setPercentAndBoth()
+        self.initValues()  # values of the deck and subdecks, computed by rollup
 
     def setConfParameters(self):
         """ Find the configuration and its name """
@@ -166,315 +186,133 @@ class DeckNode:
         self.givenUp = self.givenUpParent or self.containsGivenUpSymbol
         self.pause = self.pauseParent or self.containsPauseSymbol
 
-    def initDicts(self):
-        """ Ensure that each dictionarry is created"""
-        self.count = dict()
-        for absoluteOrPercent in ["absolute", "percent", "both"]:
-            self.count[absoluteOrPercent] = dict()
-            for kind in ["deck", "subdeck"]:
-                self.count[absoluteOrPercent][kind] = dict()
-                for isString in [True, False]:
-                    self.count[absoluteOrPercent][kind][isString] = dict()
-        self.noteSet = dict()
-        for kind in ["deck", "subdeck"]:
-            self.noteSet[kind] = dict()
-        self.timeDue = {}
-
-    def initCountFromDb(self):
-        for name in tree.values:
-            self.addCount("absolute", "deck", False, name,
-                          tree.values[name].get(self.did, 0))
-
-    def initFromAlreadyComputed(self):
-        """Put in dict values already computed by anki"""
-        for subdeckNumber, name in [(self.dueRevCards, "review today"), (self.newCardsToday, "new today"), (self.dueLrnReps, "repetition of today learning")]:
-            deckNumber = subdeckNumber
-            for child in self.children:
-                deckNumber -= child.count["absolute"]["subdeck"][False][name]
-            self.addCount("absolute", "deck", False, name, deckNumber)
-            self.addCount("absolute", "subdeck", False, name, subdeckNumber)
-
-    def absoluteDeckSum(self, newName, sum1, sum2, negate=False):
-        sum1 = self.count["absolute"]["deck"][False][sum1]
-        sum2 = self.count["absolute"]["deck"][False][sum2]
-        if negate:
-            sum2 = -sum2
-        self.addCount("absolute", "deck", False, newName, (sum1+sum2))
-
-    def initCountSum(self):
-        self.absoluteDeckSum(
-            "learning now", "learning now from today", "learning today from past")
-        self.absoluteDeckSum(
-            "learning later", "learning later today", "learning future")
-        self.absoluteDeckSum("learning card", "learning now", "learning later")
-        self.absoluteDeckSum(
-            "learning today", "learning later today", "learning now")
-
-        # Repetition
-        self.absoluteDeckSum("learning today repetition",
-                             "learning today repetition from today", "learning today repetition from past")
-        self.absoluteDeckSum(
-            "learning repetition", "learning repetition from today", "learning repetition from past")
-        self.absoluteDeckSum("learning future repetition",
-                             "learning repetition", "learning today repetition", negate=True)
-
-        # Review
-        self.absoluteDeckSum("review later", "review due",
-                             "review today", negate=True)
-        self.absoluteDeckSum("unseen later", "unseen",
-                             "new today", negate=True)
-        self.absoluteDeckSum("repetition seen today",
-                             "repetition of today learning", "review today")
-        self.absoluteDeckSum("repetition today",
-                             "repetition seen today", "new today")
-        self.absoluteDeckSum("cards seen today",
-                             "learning today", "review today")
-        self.absoluteDeckSum("today", "cards seen today", "new today")
-
-    def initNid(self):
-        """ set the set of nids of this deck"""
-        self.addSet("deck", "notes", set(mw.col.db.list(
-            """select  nid from cards where did = ?""", self.did)))
-
-    def initTimeDue(self):
-        """ Set the time for the first repetition of each deck."""
-        self.timeDue["deck"] = tree.times.get(self.did)
-        # Initialize subdeck time, it will be calculated later in setTimeDue
-        self.timeDue["subdeck"] = None
-
-    def setChildren(self):
+    def initValues(self):
+        """ Read the values and time due of this deck in the current rollup"""
+        values = rollup.current
+        row = values.index[self.did]
+        self.deckValues = values.deckValues[row]
+        self.subdeckValues = values.subdeckValues[row]
+        self.timeDueDeck = values.timeDueDeck[row]
+        self.timeDueSubdeck = values.timeDueSubdeck[row]
+
+    def setChildren(self, children=None):
         """ create node from every child and save them in
-        self.children """
+        self.children. Children of collapsed decks are not displayed, thus not created.
+        If children is given, they are used instead."""
+        if children is not None:
+            self.children = children
+            return
         self.children = list()
+        if self.collapsed:
+            return
         for oldChild in self.oldChildren:
             childNode = make(oldChild, self.ended, self.givenUp, self.pause)
             self.children.append(childNode)
 
-    def setSubdeckCount(self):
-        """Compute subdeck value, as the sum of deck, and children's subdeck value"""
-        for name in self.count["absolute"]["deck"][False]:
-            count = self.count["absolute"]["deck"][False][name]
-            for child in self.children:
-                childNb = child.count["absolute"]["subdeck"][False][name]
-                if not isinstance(childNb, int):
-                    pass
-                count += childNb
-            self.addCount("absolute", "subdeck", False, name, count)
-
-    def setSubdeckSets(self):
-        """Compute subdeck's set as union of the deck set and children subdecks set"""
-        for name in self.noteSet["deck"]:
-            newSet = self.noteSet["deck"][name]
-            for child in self.children:
-                newSet |= child.noteSet["subdeck"][name]
-            self.addSet("subdeck", name, newSet)
-
-    def setTimeDue(self):
-        """Compute first time due for subdeck using the timedue of this deck,
-        and the one of subdecks"""
-        self.timeDue["subdeck"] = self.timeDue["deck"]
-        for child in self.children:
-            if self.timeDue["subdeck"]:
-                if child.timeDue["subdeck"]:
-                    self.timeDue["subdeck"] = min(
-                        self.timeDue["subdeck"], child.timeDue["subdeck"])
-            else:
-                self.timeDue["subdeck"] = child.timeDue["subdeck"]
-
-    def setEmpty(self):
-        """Set value of isEmpty and hasEmptyDescendant. Set the colors appropriately."""
-        if not getUserOption("do color empty"):
-            return
-        self.isEmpty = self.count["absolute"]["subdeck"][False]["unseen"] == 0
-        self.hasEmptyDescendant = self.isEmpty
+    def refresh(self):
+        """Update what may have changed even if the deck did not: the deck's option's name, and the rollup"""
+        self.setConfParameters()
+        self.initValues()
 
-        if self.isEmpty:
-            if not self.ended and not self.givenUp and not self.pause:
-                self.style["color"] = getUserOption("color empty", "black")
-            return
-        for child in self.children:
-            if (child.hasEmptyDescendant and (not child.ended) and (not child.givenUp) and (not child.pause)):
-                self.hasEmptyDescendant = True
-                self.style['color'] = getUserOption(
-                    "color empty descendant", "black")
-                return
-
-    def _setPercentAndBoth(self, kind, column, base):
-        """Set percent and both count values for this kind and column. In theory, column is a subset of base.
-
-        Returns the numerator if its non null and there are no cards."""
-        ret = None
-        numerator = self.count["absolute"][kind][False][column]
-        denominator = self.count["absolute"][kind][False][base]
+    # End of initialization
+    ###########
+    # Values and texts
+
+    def number(self, kind, name):
+        """The number of cards satisfying name in the deck (if kind is "deck") or in the deck and its subdecks.
+        0 if name is not a number"""
+        index = VALUE_INDEX.get(name)
+        if index is None:
+            return 0
+        if kind == "deck":
+            return int(self.deckValues[index])
+        return int(self.subdeckValues[index])
+
+    def getTimeDue(self, kind):
+        if kind == "deck":
+            return self.timeDueDeck
+        return self.timeDueSubdeck
+
+    def percentText(self, kind, name):
+        """The percent of the cards of the deck satisfying name (of the notes if name is "notes")."""
+        numerator = self.number(kind, name)
+        denominator = self.number(kind, "notes" if name == "notes" else "cards")
         if numerator == 0:
-            percent = 0
-            percentText = "0%"
+            return "0%"
         # base can't be empty since a subset of it is not empty, as ensured by the above test
+        if denominator == 0:
+            return f"{numerator}/{denominator} ?"
+        return f"{int((100*numerator)/denominator)}%"
+
+    def textTime(self, kind):
+        """The text for the time remaining before next card, if no card in learning is due now."""
+        timeDue = self.getTimeDue(kind)
+        if self.number(kind, "learning now") or not timeDue:
+            return None
+        remainingSeconds = timeDue - int_time()
+        if remainingSeconds >= 60:
+            text = "[%dm]" % (remainingSeconds // 60)
         else:
-            if denominator == 0:
-                percent = 0
-                percentText = f"{numerator}/{denominator} ?"
-                ret = numerator
-            else:
-                percent = (100*numerator)/denominator
-                percentText = f"{int(percent)}%"
-        self.addCount("percent", kind, False, column, percent)
-        self.addCount("percent", kind, True, column, percentText)
-        both = conditionString(numerator, f"{numerator}|{percentText}")
-        self.addCount("both", kind, True, column, both)
-        return ret
-
-    def makeBar(self, kind, names):
+            text = "[%ds]" % remainingSeconds
+        # The card is counted as due now from collapseTime before it is due
+        return learning_due(text, timeDue, timeDue - mw.col.get_config('collapseTime'))
+
+    def learningAllText(self, absoluteOrPercent, kind):
+        """Text for learning all"""
+        future = self.text(absoluteOrPercent, kind, "learning future")
+        laterToday = self.text(absoluteOrPercent, kind, "learning later today")
+        if future:
+            later = nowLater(laterToday, future)
+        else:
+            later = conditionString(laterToday, parenthesis=True)
+        return nowLater(self.text(absoluteOrPercent, kind, "learning now"), later)
+
+    def text(self, absoluteOrPercent, kind, name):
+        """The text to display for name, as an absolute number, a percent, or both."""
+        if name == "learning all":
+            return self.learningAllText(absoluteOrPercent, kind)
+        if name in PAIRS:
+            first, second = PAIRS[name]
+            firstValue = self.text(absoluteOrPercent, kind, first)
+            secondValue = self.text(absoluteOrPercent, kind, second)
+            return conditionString(firstValue or secondValue, f"{firstValue}/{secondValue}")
+        if name in NOW_LATERS:
+            now, later = NOW_LATERS[name]
+            return nowLater(self.text(absoluteOrPercent, kind, now), self.text(absoluteOrPercent, kind, later))
+        if name == "learning now":
+            textTime = self.textTime(kind)
+            if textTime is not None:
+                return textTime
+        number = self.number(kind, name)
+        if absoluteOrPercent == "absolute":
+            return "{:,}".format(number) if number else ""
+        percentText = self.percentText(kind, name)
+        if absoluteOrPercent == "percent":
+            return percentText
+        return conditionString(number, f"{number}|{percentText}")
+
+    def makeBar(self, kind, segments):
+        """The progress bar of the segments (name, colour, overlay), see compileColumns"""
         total = 0
-        for name in names:
-            total += self.count['absolute'][kind][False].get(name, 0)
+        for name, _, _ in segments:
+            total += self.number(kind, name)
         if total == 0:  # empty decks don't get progress bars
             return ""
         cumulative = 0
-        content = ""
-        # for name in names:
-        for i, name in enumerate(names):
-
-            conf = getFromName(name) or {"name": name}
-            color = getColor(conf)
-            number = self.count['absolute'][kind][False].get(name, 0)
-            overlay_text = getOverlay(conf) # Changed from getOverlay(conf) to overlay_text
-            # Ensure overlay_text is a string for formatting, or provide a default
-            if overlay_text is None:
-                overlay_text = f"Data for {name}" # Default if None
-            
-            width = number*100/total
-
-            # ﾃｽﾄ : 角を丸くする ----
-            # if i == 0:
-            #     border_radius = "border-radius: 5px 0 0 5px;"
-            # elif i == len(names) - 1:
-            #     border_radius = "border-radius: 0 5px 5px 0;"
-            # else:
-            #     border_radius = ""
-            # content += bar(name, width, cumulative, color, overlay_text, border_radius)
-            # # ----
-
-            content += bar(name, width, cumulative, color, overlay_text)
+        content = []
+        for name, color, overlay in segments:
+            width = self.number(kind, name)*100/total
+            content.append(bar(name, width, cumulative, color, overlay))
             cumulative += width
-        return progress(content)
-
-    def setPercentAndBoth(self):
-        """Set percent and both count values for each kind and column
-        percent. Only considering cards.
-
-        Print in case of division by 0 for the percent computation.
-        """
-        for kind in self.count["absolute"]:
-            for column in self.count["absolute"][kind][False]:
-                ret = self._setPercentAndBoth(kind, column, "cards")
-                if ret is not None:
-                    pass
-
-    def fromSetToCount(self):
-        """Add numbers according to number of notes, for deck, subdeck, absolute, percent, both"""
-        for kind in ["deck", "subdeck"]:
-            for name in self.noteSet[kind]:
-                self.addCount("absolute", kind, False, name,
-                                len(self.noteSet[kind][name]))
-            for name in self.noteSet[kind]:
-                self._setPercentAndBoth(kind, name, "notes")
-
-    def setLearningAll(self):
-        """Set text for learning all"""
-        for absoluteOrPercent in self.count:
-            for kind in ["deck", "subdeck"]:
-                future = self.count[absoluteOrPercent][kind][True]["learning future"]
-                if future:
-                    later = nowLater(
-                        self.count[absoluteOrPercent][kind][True]["learning later today"], future)
-                else:
-                    later = conditionString(
-                        self.count[absoluteOrPercent][kind][True]["learning later today"], parenthesis=True)
-                string = nowLater(
-                    self.count[absoluteOrPercent][kind][True]["learning now"], later)
-                self.addCount(absoluteOrPercent, kind,
-                              True, "learning all", string)
-
-    def setTextTime(self):
-        """set text for the time remaining before next card"""
-        for kind in ["deck", "subdeck"]:
-            learningNow = self.count["absolute"][kind][False]["learning now"]
-            for absoluteOrPercent in self.count:
-                if not learningNow and self.timeDue.get(kind) is not None and self.timeDue[kind] != 0:
-                    current_due_time = self.timeDue[kind]
-                    try:
-                        remainingSeconds = current_due_time - int_time()
-                        if remainingSeconds >= 60:
-                            self.addCount(absoluteOrPercent, kind, True, "learning now", "[%dm]" % (
-                                remainingSeconds // 60))
-                        else:
-                            self.addCount(absoluteOrPercent, kind, True,
-                                          "learning now", "[%ds]" % remainingSeconds)
-                    except TypeError:
-                        # Isso não deve acontecer se current_due_time for um número.
-                        # Adicionado para depuração caso o problema persista.
-                        print(f"DEBUG: Error in setTextTime. kind={kind}, current_due_time={current_due_time}, type={type(current_due_time)}")
-                        pass # Evita que o addon quebre aqui.
-
-    def setPairs(self):
-        """Set text for columns which are pair"""
-        for absoluteOrPercent in self.count:
-            for kind in ["deck", "subdeck"]:
-                for first, second in [("mature", "young"), ("notes", "cards"), ("buried", "suspended"), ("reviewed today", "repeated today")]:
-                    name = f"{first}/{second}"
-                    firstValue = self.count[absoluteOrPercent][kind][True][first]
-                    secondValue = self.count[absoluteOrPercent][kind][True][second]
-                    values = conditionString(firstValue or secondValue, f"{firstValue}/{secondValue}")
-                    self.addCount(absoluteOrPercent, kind, True, name, values)
-
-    def setNowLaters(self):
-        """ Set text for the pairs with cards to see now, and other to see later/another day"""
-        for absoluteOrPercent in self.count:
-            for kind in ["deck", "subdeck"]:
-                for name, left, right in [
-                    ("review",         "review today", "review later"),
-                    ("unseen new",     "new today",    "unseen later"),
-                    ("learning today", "learning now", "learning later today"),
-                ]:
-                    value = nowLater(self.count[absoluteOrPercent][kind][True]
-                                     [left], self.count[absoluteOrPercent][kind][True][right])
-                    self.addCount(absoluteOrPercent, kind, True, name, value)
-
-    def setText(self):
-        self.setTextTime()
-        self.setLearningAll()
-        self.setPairs()
-        self.setNowLaters()
-
-    # End of initialization
-    ###########
-    # Initialization tool
-
-    def addCount(self, absoluteOrPercent, kind, isString, name,  value):
-        """Ensure that self.count[absoluteOrPercent][kind][name] is defined and equals value"""
-        self.count[absoluteOrPercent][kind][isString][name] = value
-        if isString is False:
-            if value:
-                self.count[absoluteOrPercent][kind][True][name] = "{:,}".format(
-                    value)
-            else:
-                self.count[absoluteOrPercent][kind][True][name] = ""
-
-    def addSet(self, kind, name, value):
-        """Ensure that self.noteSet[kind][name] is defined and equals value"""
-        self.noteSet[kind][name] = value
+        return progress("".join(content))
 
     ########################
     # Printing
     def emptyRow(self, cnt):
-        if self.did == 1 and cnt > 1 and not self.children:
+        """Whether the row is hidden. Rows of decks with a collapsed parent are never created."""
+        if self.did == 1 and cnt > 1 and not self.hasChildren:
             # if the default deck is empty, hide it
-            if not self.count["absolute"]["subdeck"][False]["cards"]:
-                return True
-        # parent toggled for collapsing
-        for parent in mw.col.decks.parents(self.did):
-            if parent['collapsed']:
+            if not self.number("subdeck", "cards"):
                 return True
 
     def getOpenTr(self, collapsed, haveSubdeck):
@@ -491,11 +329,9 @@ class DeckNode:
         return "" # Desabilitar estilos customizados de linha
 
     def getCollapse(self):
-        # We reload the deck. The collapsed state may have changed.
-        self.deck = mw.col.decks.get(self.did)
-        prefix = "+" if self.deck['collapsed'] else "-"
+        prefix = "+" if self.collapsed else "-"
         # deck link
-        if self.children:
+        if self.hasChildren:
             return collapse_children_html(self.did, self.deck["name"], prefix)
         else:
             return collapse_no_child
@@ -509,183 +345,218 @@ class DeckNode:
     def getName(self, depth):
         return deck_name(depth, self.getCollapse(), self.getExtraClass(), self.did, self.getCss(), self.name)
 
+    def numberCells(self):
+        """The HTML of the cell of each displayed column"""
+        with profiling.timed("texts"):
+            return self.computeNumberCells()
+
+    def computeNumberCells(self):
+        cells = []
+        for kind, number, name, index, segments, colour, whatToDo, start, middle, _, _ in columnPlan():
+            if index is not None:
+                value = int(self.deckValues[index] if kind == "deck" else self.subdeckValues[index])
+                contents = "{:,}".format(value) if value else ""
+            elif segments is not None:
+                contents = self.makeBar(kind, segments)
+            else:
+                contents = self.text(number, kind, name)
+            # In some case, we decided contents is empty. Instead of having complex value such as "0/0%" or "0(0)". Then we set it back to 0, which nicely summarize everything.
+            if contents == "":
+                contents = 0
+            if contents in [0, "0", "0%", ""]:
+                if whatToDo is False:
+                    contents = ""
+                elif isinstance(whatToDo, str):
+                    colour = whatToDo
+            cells.append(f"{start}{colour}{middle}{contents}{number_cell_end}")
+        return cells
+
     def getNumberColumns(self):
-        buf = ""
-        for conf in getUserOption("columns"):
-            if conf.get("present", True):
-                name = conf["name"]
-                if name == "new":
-                    # It used to be called "new". Introduced back for retrocomputability.
-                    name = "new today"
-                    conf["name"] = "new today"
-                    writeConfig()
-                if conf.get("percent", False):
-                    if conf.get("absolute", False):
-                        number = "both"
-                    else:
-                        number = "percent"
-                else:
-                    number = "absolute"
-                kind = "subdeck" if conf.get("subdeck", False) else "deck"
-                if name == "bar":
-                    if not "names" in conf:
-                        print("""A configuration whose name is "bar", should have a field "names".""", file=sys.stderr)
-                        continue
-                    contents = self.makeBar(kind, conf["names"])
-                else:
-                    countNumberKind = self.count[number][kind][True]
-                    if name not in countNumberKind:
-                        if name not in warned:
-                            warned.add(name)
-                            print(
-                                f"The add-on anki_simplified_deck_stats does not know any column whose name is {name}. It thus won't be displayed. Please correct your add-on's configuration.", file=sys.stderr)
-                        continue
-                    contents = countNumberKind[name]
-                colour = getColor(conf)
-                # In some case, we decided contents is empty. Instead of having complex value such as "0/0%" or "0(0)". Then we set it back to 0, which nicely summarize everything.
-                if contents == "":
-                    contents = 0
-                if contents in [0, "0", "0%", ""]:
-                    whatToDo = getUserOption("color zero")
-                    if whatToDo is False:
-                        contents = ""
-                    elif isinstance(whatToDo, str):
-                        colour = whatToDo
-                buf += number_cell(colour, contents, getOverlay(conf))
-        return buf
+        return "".join(self.numberCells())
 
     def getOptionName(self):
         if getUserOption("option"):  # If it's not filtered
             return deck_option_name(self.confName)
         return ""
 
+    def rowParts(self, depth):
+        """The HTML of this row: the opening tag, the name cell, the tuple of number cells, and the end of the row."""
+        return (self.getOpenTr(self.collapsed, self.hasChildren),
+                self.getName(depth),
+                tuple(self.numberCells()),
+                gear(self.did) + self.getOptionName() + end_line)
+
+    def addRows(self, rows, depth, cnt):
+        """Append (did, rowParts) of this deck and of its displayed descendants to rows."""
+        if self.emptyRow(cnt):
+            return
+        rows.append((self.did, self.rowParts(depth)))
+        for child in self.children:
+            child.addRows(rows, depth+1, len(self.children))
+
     def htmlRow(self, col, depth, cnt):
         "Generate the HTML table cells for this row of the deck tree."
-        if self.emptyRow(cnt):
-            return ""
-        return (
-            self.getOpenTr(self.deck['collapsed'], self.children) +
-            self.getName(depth) +
-            self.getNumberColumns() +
-            gear(self.did) +
-            self.getOptionName() +
-            end_line +
-            col._renderDeckTree(self.children, depth+1)
-        )
+        rows = []
+        self.addRows(rows, depth, cnt)
+        return "".join(rowHtml(parts) for _, parts in rows)
+
+
+def rowHtml(parts):
+    openTr, name, cells, end = parts
+    return openTr + name + "".join(cells) + end
+
+
+def virtualTable(rows):
+    """The rows (did, rowParts) as sent to virtualRows in deckbrowser.js:
+    the deck ids, the distinct parts of rows, and for each row the
+    indexes of its parts. Cells are often equal, so each is sent once."""
+    index = dict()
+    fragments = []
+    indexes = []
+    for _, (openTr, name, cells, end) in rows:
+        row = []
+        for fragment in (openTr, name, *cells, end):
+            position = index.get(fragment)
+            if position is None:
+                position = index[fragment] = len(fragments)
+                fragments.append(fragment)
+            row.append(position)
+        indexes.append(row)
+    return [did for did, _ in rows], fragments, indexes
+
+
+def countsFromOldNode(oldNode):
+    """The name, and number of cards, anki computed for this node"""
+    try:
+        name, _, dueRevCards, dueLrnReps, newCardsToday, _ = oldNode
+        return name, dueRevCards, dueLrnReps, newCardsToday
+    except:
+        return oldNode.name, oldNode.review_count, oldNode.learn_count, oldNode.new_count
+
+
+def cacheKey(did, oldNode, endedParent, givenUpParent, pauseParent):
+    """Everything a DeckNode depends on, apart from its children and the current time."""
+    deck = mw.col.decks.get(did)
+    return (countsFromOldNode(oldNode), deck.get("mod"), deck.get("conf"), collapsedFromOldNode(oldNode, deck),
+            endedParent, givenUpParent, pauseParent,
+            tree.deckSignature(did), getVersion())
 
 
 def make(oldNode, endedParent=False, givenUpParent=False, pauseParent=False):
-    """Essentially similar to DeckNode, but return an element already computed if it exists in the base"""
+    """Essentially similar to DeckNode, but return an element already computed if neither the deck nor its descendants changed"""
     did = idFromOldNode(oldNode)
-    if oldNode is not idToOldNode.get(did):
-        node = DeckNode(mw, oldNode, endedParent, givenUpParent, pauseParent)
-        idToNode[did] = node
-        idToOldNode[did] = oldNode
-    return idToNode[did]
+    key = cacheKey(did, oldNode, endedParent, givenUpParent, pauseParent)
+    node = idToNode.get(did)
+    children = None
+    if node is not None and idToKey.get(did) == key:
+        # The key fixes collapsed, ended, givenUp and pause, so those children are valid for a new node too
+        children = [] if node.collapsed else [make(oldChild, node.ended, node.givenUp, node.pause)
+                                              for oldChild in childrenFromOldNode(oldNode)]
+        if all(child is oldChild for child, oldChild in zip(children, node.children)) and len(children) == len(node.children):
+            node.refresh()
+            return node
+    node = DeckNode(mw, oldNode, endedParent, givenUpParent, pauseParent, children)
+    idToNode[did] = node
+    idToKey[did] = key
+    return node
 
 # based on Anki 2.0.36 aqt/deckbrowser.py DeckBrowser._renderDeckTree
 
 from aqt.deckbrowser import DeckBrowser
 
+def makeNodes(nodes):
+    """The DeckNodes of the top level decks of anki's deck tree, after computing the values they need"""
+    try:
+        oldNodes = list(nodes)
+    except:
+        oldNodes = list(nodes.children)
+    with profiling.timed("flatten"):
+        dids, parents, ankiCounts = flattenOldNodes(oldNodes)
+    parentIds = {did: dids[parent] if parent >= 0 else None
+                 for did, parent in zip(dids, parents)}
+    tree.refreshParents(parentIds)
+    if tree.canComputeInBackground():
+        # The table is updated once values are computed, see partialUpdate.onComputed
+        tree.computeAllInBackground(parentIds)
+    else:
+        tree.computeAll(parentIds)
+    with profiling.timed("rollup"):
+        rollup.compute(tuple(dids), tuple(parents), tuple(ankiCounts))
+    with profiling.timed("nodes"):
+        return [make(node) for node in oldNodes]
+
+
+def columnHeaders():
+    """The header of each displayed column. Columns which can't be displayed have no header either."""
+    return tuple(column_header(spec.header, spec.colpos) for spec in columnPlan())
+
+
+def headerEnd():
+    """The end of the header, after the columns"""
+    end = option_header  # for deck's option
+    if getUserOption("option"):
+        end += option_name_header_html(tr("col_preset_header"))
+    return end + end_header
+
+
+def tableState(nodes):
+    """Everything displayed in the table of anki's deck tree nodes: the
+    column headers, the end of the header, and the list of (did, rowParts)
+    of the displayed decks. See partialUpdate.py
+
+    Profiling starts here if the option "profile" is set."""
+    profiling.active = getUserOption("profile", False)
+    nodes = makeNodes(nodes)
+    rows = []
+    # Includes the texts of the cells, also timed as "texts"
+    with profiling.timed("rows") as timer:
+        for node in nodes:
+            node.addRows(rows, 0, len(nodes))
+        timer.rows = len(rows)
+    return columnHeaders(), headerEnd(), rows
+
+
+def isVirtual(rows):
+    """Whether only the rows in the viewport are in the page, because there are more rows than the option "virtualize rows above"."""
+    limit = getUserOption("virtualize rows above", 1000)
+    return limit is not None and len(rows) > limit
+
+
+# The tableState currently displayed in the deck browser, None if unknown
+displayed = None
+# Whether the displayed table is virtual, see isVirtual
+virtual = False
+
+
 def renderDeckTree(self:"DeckBrowser", nodes, depth=0):
+    """The HTML of the deck tree. Rows are appended to a single list, joined once."""
+    global displayed, virtual
     # Look at aqt/deckbrowser.py for a description of oldNode
     if not nodes:
         return ""
+    out = []
     if depth == 0:
-        tree.computeValues()
-        tree.computeTime()
-        buf = f"""<style>{css}</style><script>{js}</script>{start_header}{deck_header}"""
-        for colpos, conf in enumerate(getUserOption("columns")):
-            if conf.get("present", True):
-                buf += column_header(getHeader(conf), colpos)
-        buf += option_header  # for deck's option
-        if getUserOption("option"):
-            buf += option_name_header_html(tr("col_preset_header"))
-        buf += end_header
-
-        # convert nodes
-        try:
-            nodes = [make(node) for node in nodes]
-        except:
-            nodes = [make(node) for node in nodes.children]
-
-        buf += self._topLevelDragRow()
+        displayed = tableState(nodes)
+        headers, end, rows = displayed
+        virtual = isVirtual(rows)
+        # deckbrowser.js and defaultcss.css are loaded by the page, see changeFunction.py
+        out.append(f"""{start_header}{deck_header}""")
+        out.extend(headers)
+        out.append(end)
+        out.append(self._topLevelDragRow())
     else:
-        buf = ""
-    for node in nodes:
-        buf += self._deckRow(node, depth, len(nodes))
+        rows = []
+        for node in nodes:
+            node.addRows(rows, depth, len(nodes))
+    with profiling.timed("html"):
+        if depth == 0 and virtual:
+            out.append(virtual_rows(*virtualTable(rows)))
+        else:
+            for _, parts in rows:
+                out.append(rowHtml(parts))
+        if depth == 0:
+            out.append(self._topLevelDragRow())
+        html = "".join(out)
     if depth == 0:
-        buf += self._topLevelDragRow()
-        end = time.time()
-    return buf
-
-
-# def renderDeckTree(self:"DeckBrowser", nodes, depth=0):
-#     print(f"renderDeckTree called with nodes type={type(nodes)}, depth={depth}")
-#     # Look at aqt/deckbrowser.py for a description of oldNode
-#     if not nodes:
-#         print("No nodes provided, returning empty string")
-#         return ""
-#     if depth == 0:
-#         print("Processing root level (depth=0)")
-#         tree.computeValues()
-#         print("Tree values computed")
-#         tree.computeTime()
-#         print("Tree time computed")
-#         buf = f"""<style>{css}</style><script>{js}</script>{start_header}{deck_header}"""
-#         print(f"Headers initialized, columns count: {len(getUserOption('columns'))}")
-#         for colpos, conf in enumerate(getUserOption("columns")):
-#             # print(f"Processing column {colpos}: name={conf.get('name', 'unknown')}")
-#             if conf.get("present", True):
-#                 print(f"Processing column {colpos}: name={conf.get('name', 'unknown')}")
-#                 print(f"  Adding column header: {getHeader(conf)}")
-#                 buf += column_header(getHeader(conf), colpos)
-#             # else:
-#             #     print(f"  Column {colpos} is not present, skipping")
-#         print("Adding option header")
-#         buf += option_header  # for deck's option
-#         if getUserOption("option"):
-#             print("Option enabled, adding option_name_header")
-#             buf += option_name_header
-#         # else:
-#         #     print("Option disabled, skipping option_name_header")
-#         buf += end_header
-#         print("Headers completed")
-
-#         # convert nodes
-#         try:
-#             print(f"Converting nodes, count: {len(nodes) if hasattr(nodes, '__len__') else 'unknown'}")
-#             nodes = [make(node) for node in nodes]
-#             print(f"Nodes successfully converted, new count: {len(nodes)}")
-#         except Exception as e:
-#             print(f"Exception in node conversion: {str(e)}, trying nodes.children")
-#             try:
-#                 nodes = [make(node) for node in nodes.children]
-#                 print(f"Conversion from nodes.children successful, count: {len(nodes)}")
-#             except Exception as e2:
-#                 print(f"Failed to convert nodes.children as well: {str(e2)}")
-
-#         print("Adding top level drag row")
-#         buf += self._topLevelDragRow()
-#     else:
-#         print(f"Processing nested level, depth={depth}")
-#         buf = ""
-    
-#     print(f"Starting to process {len(nodes)} nodes at depth {depth}")
-#     for i, node in enumerate(nodes):
-#         print(f"Processing node {i+1}/{len(nodes)} at depth {depth}: did={node.did if hasattr(node, 'did') else 'unknown'}")
-#         buf += self._deckRow(node, depth, len(nodes))
-#         print(f"Node {i+1}/{len(nodes)} processed")
-    
-#     if depth == 0:
-#         print("Back at root level, adding final top level drag row")
-#         buf += self._topLevelDragRow()
-#         end = time.time()
-#         print(f"renderDeckTree completed, buffer length: {len(buf)}")
-#     return buf
-
-
-# based on Anki 2.0.45 aqt/main.py AnkiQt.onRefreshTimer
-def onRefreshTimer():
-    if mw.state == "deckBrowser":
-        mw.deckBrowser._renderPage()  # was refresh, but we're disabling that
+        profiling.report("render")
+    return html
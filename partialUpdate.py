@@ -0,0 +1,152 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Update the deck browser's table without reloading the page.
+
+The table displayed is node.displayed. When it must change, only the
+differences are sent, as JSON, to patchDeckBrowser in deckbrowser.js.
+When the differences can't be expressed this way, the page must be
+rendered again."""
+
+import json
+
+from aqt import mw
+from aqt.deckbrowser import DeckBrowser
+
+from . import node, profiling, tree
+
+lastRenderPage = DeckBrowser._renderPage
+
+
+def diff(old, new):
+    """The changes from the table old to the table new, as expected by
+    patchDeckBrowser, or None if the page must be rendered again.
+
+    headers -- associate to the position of a displayed column its new header
+    remove -- the ids of the decks whose row is removed
+    rows -- the list of [did, previous did or None, html] of rows to replace, or to insert after the previous deck's row
+    cells -- associate to deck ids a dict from position of displayed columns to new cells"""
+    oldHeaders, oldEnd, oldRows = old
+    newHeaders, newEnd, newRows = new
+    if len(oldHeaders) != len(newHeaders) or oldEnd != newEnd:
+        return None
+    oldParts = dict(oldRows)
+    newDids = {did for did, _ in newRows}
+    # Rows are inserted and removed, but never moved
+    if [did for did, _ in oldRows if did in newDids] != [did for did, _ in newRows if did in oldParts]:
+        return None
+
+    headers = {position: header for position, (oldHeader, header) in enumerate(zip(oldHeaders, newHeaders))
+               if oldHeader != header}
+    remove = [did for did, _ in oldRows if did not in newDids]
+    rows = []
+    cells = dict()
+    previous = None
+    for did, parts in newRows:
+        before = oldParts.get(did)
+        if before is None or before[0] != parts[0] or before[1] != parts[1] or before[3] != parts[3]:
+            rows.append([did, previous, node.rowHtml(parts)])
+        else:
+            changed = {position: cell for position, (oldCell, cell) in enumerate(zip(before[2], parts[2]))
+                       if oldCell != cell}
+            if changed:
+                cells[did] = changed
+        previous = did
+    return {"headers": headers, "remove": remove, "rows": rows, "cells": cells}
+
+
+def virtualChanges(changes, new):
+    """The changes of diff, as expected by patchVirtualRows: rows whose
+    cells changed are replaced entirely, since only the rows in the
+    viewport are in the page."""
+    parts = dict(new[2])
+    rows = list(changes["rows"])
+    rows.extend([did, None, node.rowHtml(parts[did])] for did in changes["cells"])
+    return {"headers": changes["headers"], "remove": changes["remove"], "rows": rows, "cells": dict()}
+
+
+def updateDeckTree(browser, nodes=None):
+    """Patch the deck browser's table to show anki's deck tree nodes (by
+    default, the current one). Return False if the page must be rendered
+    again instead."""
+    if node.displayed is None or mw.state != "deckBrowser":
+        return False
+    if nodes is None:
+        nodes = mw.col.sched.deck_due_tree()
+    new = node.tableState(nodes)
+    if node.isVirtual(new[2]) != node.virtual:
+        return False
+    with profiling.timed("diff"):
+        changes = diff(node.displayed, new)
+    if changes is None:
+        return False
+    node.displayed = new
+    if node.virtual:
+        changes = virtualChanges(changes, new)
+    if any(changes.values()):
+        with profiling.timed("patch") as timer:
+            function = "patchVirtualRows" if node.virtual else "patchDeckBrowser"
+            browser.web.eval(f"{function}({json.dumps(changes)});")
+            timer.rows = len(changes["rows"]) + sum(len(cells) for cells in changes["cells"].values())
+    profiling.report("partial update")
+    return True
+
+
+def reorderColumns(order):
+    """Take into account that deckbrowser.js displays the column at
+    position order[i] at position i. Return False if the displayed
+    table is unknown, and the page must be rendered again."""
+    if node.displayed is None or mw.state != "deckBrowser":
+        return False
+    _, end, rows = node.displayed
+    node.displayed = (node.columnHeaders(), end,
+                      [(did, (openTr, name, tuple(cells[index] for index in order), rowEnd))
+                       for did, (openTr, name, cells, rowEnd) in rows])
+    if node.virtual:
+        # Only the rows in the viewport were reordered
+        _, fragments, indexes = node.virtualTable(node.displayed[2])
+        mw.deckBrowser.web.eval(f"setVirtualRows({json.dumps(fragments)}, {json.dumps(indexes)});")
+    return True
+
+
+def onComputed():
+    """Display the values computed in background"""
+    if mw.state == "deckBrowser":
+        if not updateDeckTree(mw.deckBrowser):
+            mw.deckBrowser._renderPage()
+
+
+tree.onComputed.append(onComputed)
+
+
+# based on Anki 2.0.45 aqt/main.py AnkiQt.onRefreshTimer
+def onRefreshTimer():
+    """Show the numbers which changed with time. Called by deckbrowser.js
+    when a card in learning is due; the time before it is counted down
+    in the page."""
+    if mw.state == "deckBrowser":
+        if not updateDeckTree(mw.deckBrowser):
+            mw.deckBrowser._renderPage()  # was refresh, but we're disabling that
+
+
+def renderPage(self, *args, **kwargs):
+    """DeckBrowser._renderPage. When the page is rendered again from the
+    same tree, as when a deck is collapsed, only patch the table."""
+    reuse = kwargs.get("reuse", args[0] if args else False)
+    renderData = getattr(self, "_render_data", None)
+    if reuse and renderData is not None and updateDeckTree(self, renderData.tree):
+        return
+    lastRenderPage(self, *args, **kwargs)
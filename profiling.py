@@ -0,0 +1,98 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Time spent in each step of a render, enabled by the option "profile".
+
+Steps are timed with
+
+    with profiling.timed("name") as timer:
+        rows = ...
+        timer.rows = len(rows)
+
+Steps with the same name are summed. When a render ends, report prints
+one JSON line in the console. This module does not depend on anki, so
+that queries.py can use it."""
+
+import json
+import sys
+import time
+
+# Whether steps are recorded. Set at the beginning of each render.
+active = False
+# The (name, seconds, rows) of the steps since the last report. Steps
+# run in a background thread are reported with the next render.
+entries = []
+# The last dictionary printed by report
+last = None
+
+
+class Timer:
+    """Record the time spent in a with block"""
+    __slots__ = ("name", "rows", "start")
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        entries.append((self.name, time.perf_counter() - self.start, self.rows))
+
+
+class NoTimer:
+    """A Timer recording nothing, used when profiling is not active"""
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+
+noTimer = NoTimer()
+
+
+def timed(name):
+    """A context manager recording the time of the step name, if profiling is active."""
+    return Timer(name) if active else noTimer
+
+
+def report(label):
+    """Print the steps recorded since the last report, as JSON, and forget them."""
+    global last
+    if not entries:
+        return
+    steps = dict()
+    recorded = entries[:]
+    # Steps may be appended meanwhile by a background thread
+    del entries[:len(recorded)]
+    for name, seconds, rows in recorded:
+        step = steps.setdefault(name, {"name": name, "ms": 0.0, "calls": 0})
+        step["ms"] += seconds*1000
+        step["calls"] += 1
+        if rows is not None:
+            step["rows"] = step.get("rows", 0) + rows
+    for step in steps.values():
+        step["ms"] = round(step["ms"], 3)
+    last = {"render": label, "steps": list(steps.values())}
+    print(f"Enhance main window profile: {json.dumps(last)}", file=sys.stderr)
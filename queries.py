@@ -0,0 +1,212 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""SQL for the per-deck counters.
+
+This module does not depend on anki, so that the queries can be run
+against any database object having an `all` method (Anki's DBProxy or
+the benchmarks' sqlite wrapper)."""
+
+from collections import namedtuple
+
+from . import profiling
+from .consts import *
+
+
+def queriesCardCount(cutoff, today, yesterdayLimit):
+    """The list of (name, condition, addend, table) of the counters computed in the database.
+
+    An empty addend means that rows are counted. An empty table means
+    the table `cards`."""
+    tomorrow = today+1
+    return [
+        ("due tomorrow", f"queue in ({QUEUE_REV},{QUEUE_DAY_LRN}) and due = {tomorrow}", "", ""),
+
+        ("learning today from past", f"queue = {QUEUE_DAY_LRN} and due <= {today}", "", ""),
+        ("learning future", f"queue = {QUEUE_DAY_LRN} and due > {today}", "", ""),
+        ("learning today repetition from past", f"queue = {QUEUE_DAY_LRN}", f"left/1000", ""),
+        ("learning repetition from past", f"queue = {QUEUE_DAY_LRN}", f"mod%1000", ""),
+
+        ("learning now from today", f"queue in ({QUEUE_LRN}, {QUEUE_PREVIEW}) and due <= {cutoff}", "", ""),
+        ("learning later today", f"queue in ({QUEUE_LRN}, {QUEUE_PREVIEW}) and due > {cutoff}", "", ""),
+        ("learning today repetition from today", f"queue in ({QUEUE_LRN}, {QUEUE_PREVIEW})", f"left/1000", ""),
+        ("learning repetition from today", f"queue in ({QUEUE_LRN}, {QUEUE_PREVIEW})", f"mod%1000", ""),
+
+        ("review due", f"queue = {QUEUE_REV} and due <= {today}", "", ""),
+        ("reviewed today", f"queue = {QUEUE_REV} and due>0 and due-ivl = {today}", "", ""),
+        ("repeated today", f"revlog.id>{yesterdayLimit}", "", "revlog inner join cards on revlog.cid = cards.id"),
+
+        ("unseen", f"queue = {QUEUE_NEW_CRAM}", "", ""),
+        ("buried", f"queue = {QUEUE_USER_BURIED}  or queue = {QUEUE_SCHED_BURIED}", "", ""),
+        ("suspended", f"queue = {QUEUE_SUSPENDED}", "", ""),
+        ("cards", "", "", ""),
+        ("undue", f"queue = {QUEUE_REV} and due >  {today}", "", ""),
+        ("mature", f"queue = {QUEUE_REV} and ivl >= 21", "", ""),
+        ("young", f"queue = {QUEUE_REV} and 0<ivl and ivl <21", "", ""),
+    ]
+
+
+# The names of the counters computed in the database
+COUNTER_NAMES = tuple(query[0] for query in queriesCardCount(0, 0, 0))
+REPEATED_TODAY = "repeated today"
+
+
+def groupByQuery(condition, addend, table, nid=None):
+    """The query counting a single counter for each deck.
+
+    If nid is given, only the cards of this note are counted."""
+    if addend:
+        element = f" sum({addend})"
+    else:
+        element = f" count(*)"
+    if nid is not None:
+        condition = f"({condition}) and cards.nid = {int(nid)}" if condition else f"cards.nid = {int(nid)}"
+    if condition:
+        condition = f" where {condition}"
+    if not table:
+        table = "cards"
+    return f"select did, {element} from {table} {condition} group by did"
+
+
+def sumColumn(condition, addend):
+    """A column of the single pass query, equal to the counter of a group by query."""
+    if not condition:
+        if addend:
+            return f"sum({addend})"
+        return "count(*)"
+    return f"sum(case when ({condition}) then {addend or 1} else 0 end)"
+
+
+def singlePassQuery(queries, nid=None, idRange=None, rangeColumn="id"):
+    """The query computing every counter of `cards` in one scan.
+
+    Queries on another table are ignored, they are run by
+    `valuesPerQuery`. If nid is given, only the cards of this note are
+    counted. If idRange (first, last) is given, only the cards whose
+    rangeColumn is between first and last are counted."""
+    columns = ", ".join(sumColumn(condition, addend)
+                        for _, condition, addend, table in queries if not table)
+    if nid is not None:
+        where = f"where nid = {int(nid)}"
+    elif idRange is not None:
+        where = f"where {rangeColumn} between {int(idRange[0])} and {int(idRange[1])}"
+    else:
+        where = ""
+    return f"select did, {columns} from cards {where} group by did"
+
+
+def idRanges(first, last, parts):
+    """At most `parts` ranges (first, last) covering the integers from first to last, for idRange."""
+    if first is None or last is None:
+        return []
+    size = max(1, -(-(last - first + 1) // parts))
+    return [(start, min(start + size - 1, last)) for start in range(first, last + 1, size)]
+
+
+def valuesPerQuery(db, queries, nid=None):
+    """Associate [column name][deck id] to the value of the counter,
+    using one group by query per counter."""
+    values = dict()
+    for name, condition, addend, table in queries:
+        values[name] = dict()
+        with profiling.timed(f"values{'' if nid is None else ' of a note'}: {name}") as timer:
+            rows = db.all(groupByQuery(condition, addend, table, nid))
+            timer.rows = len(rows)
+        for did, value in rows:
+            values[name][did] = value
+    return values
+
+
+def valuesSinglePass(db, queries, nid=None, idRange=None, rangeColumn="id"):
+    """Same as valuesPerQuery, with a single scan of `cards` and one
+    query by other table. idRange only restricts the scan of `cards`,
+    see singlePassQuery."""
+    cardNames = [name for name, _, _, table in queries if not table]
+    values = {name: dict() for name, _, _, _ in queries}
+    with profiling.timed(f"values{'' if nid is None else ' of a note'}: single pass") as timer:
+        rows = db.all(singlePassQuery(queries, nid, idRange, rangeColumn))
+        timer.rows = len(rows)
+    for row in rows:
+        did = row[0]
+        for name, value in zip(cardNames, row[1:]):
+            values[name][did] = value
+    values.update(valuesPerQuery(
+        db, [query for query in queries if query[3]], nid))
+    return values
+
+
+# What repeatedToday read: the yesterdayLimit it was called with, the
+# greatest revlog id read, the (number, sum) of the revlog ids read, the
+# number of revlog rows of each card id, and the deck of those cards
+# (None for deleted cards)
+RepeatedState = namedtuple("RepeatedState", ["limit", "lastId", "checksum", "repetitions", "decks"])
+
+
+def newReviewsQuery(lastId):
+    """The id and card id of the revlog rows after lastId, a search on revlog's primary key."""
+    return f"select id, cid from revlog where id > {int(lastId)}"
+
+
+def cardDecksQuery(cids):
+    """The id and deck of the cards of cids, a search on cards' primary key."""
+    return f"select id, did from cards where id in ({', '.join(map(str, cids))})"
+
+
+def repeatedToday(db, yesterdayLimit, state=None):
+    """The counter "repeated today" of each deck, and the state to give
+    to the next call. Same as the group by query of queriesCardCount,
+    without joining revlog with every card.
+
+    Only the revlog rows after the last id read in state are read, by
+    a search on revlog's primary key. If the rows already read changed
+    (an undone review, or reviews received by a sync), today's rows are
+    read again. Only the cards whose deck is not in state are searched
+    in cards, so the state must be dropped when cards change deck.
+    state is not modified, so that the function can run in a background
+    thread."""
+    if state is not None and state.limit == yesterdayLimit and state.lastId > yesterdayLimit:
+        checksum = db.all(
+            f"select count(), coalesce(sum(id), 0) from revlog where id > {int(yesterdayLimit)} and id <= {int(state.lastId)}")[0]
+        if tuple(checksum) != state.checksum:
+            state = RepeatedState(yesterdayLimit, yesterdayLimit, (0, 0), dict(), state.decks)
+    if state is None or state.limit != yesterdayLimit:
+        state = RepeatedState(yesterdayLimit, yesterdayLimit, (0, 0), dict(), dict())
+    lastId = state.lastId
+    count, total = state.checksum
+    repetitions = dict(state.repetitions)
+    decks = dict(state.decks)
+    with profiling.timed("values: repeated today, new reviews") as timer:
+        rows = db.all(newReviewsQuery(lastId))
+        timer.rows = len(rows)
+    for id, cid in rows:
+        repetitions[cid] = repetitions.get(cid, 0) + 1
+        count += 1
+        total += id
+        if id > lastId:
+            lastId = id
+    unknown = [cid for cid in repetitions if cid not in decks]
+    if unknown:
+        with profiling.timed("values: repeated today, decks") as timer:
+            rows = db.all(cardDecksQuery(unknown))
+            timer.rows = len(rows)
+        decks.update(dict.fromkeys(unknown))
+        decks.update(rows)
+    values = dict()
+    for cid, repetition in repetitions.items():
+        did = decks[cid]
+        if did is not None:
+            values[did] = values.get(did, 0) + repetition
+    return values, RepeatedState(yesterdayLimit, lastId, (count, total), repetitions, decks)
@@ -0,0 +1,117 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Query plans of the add-on's queries, and the indexes the add-on may add.
+
+diagnose runs EXPLAIN QUERY PLAN on each query and flags full scans
+and temporary B-trees. Each index of INDEXES is owned by the add-on:
+its name starts with INDEX_PREFIX, it can be created with
+createIndexes and removed with dropIndexes, without touching anki's
+own indexes. This module does not depend on anki, so that the
+benchmarks can use it."""
+
+import re
+import sys
+
+INDEX_PREFIX = "ix_enhance_main_window_"
+
+# (name, table, columns, kinds): an index for the queries of the given
+# kinds, see tree.queryTexts. Each index covers its queries, so that
+# sqlite reads the index in deck (or note) order, without reading the
+# table or sorting.
+INDEXES = [
+    (f"{INDEX_PREFIX}counters", "cards", ("did", "queue", "due", "ivl", "left", "mod"), ("counters", "times")),
+    (f"{INDEX_PREFIX}notes", "cards", ("nid", "did"), ("notes",)),
+]
+
+SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(.*)$")
+TEMP_BTREE = re.compile(r"^USE TEMP B-TREE FOR (.*)$")
+
+
+def explain(db, sql):
+    """The details of the query plan of sql, in order."""
+    return [row[-1] for row in db.all(f"explain query plan {sql}")]
+
+
+def problems(details):
+    """The parts of a query plan which are slow on a large collection."""
+    result = []
+    for detail in details:
+        scan = SCAN.match(detail)
+        # Reading a whole covering index is as fast as counting can be
+        if scan and "COVERING INDEX" not in scan.group(2):
+            table, how = scan.groups()
+            result.append(f"full scan of {table}{how}")
+        btree = TEMP_BTREE.match(detail)
+        if btree:
+            result.append(f"temporary B-tree for {btree.group(1)}")
+    return result
+
+
+def existingIndexes(db):
+    """The names of the indexes of INDEXES which are in the database."""
+    return set(db.list(f"select name from sqlite_master where type = 'index' and name glob '{INDEX_PREFIX}*'"))
+
+
+def diagnose(db, queries):
+    """For each (kind, sql) of queries, the tuple (kind, sql, details, problems, proposals).
+
+    proposals -- the names of the indexes of INDEXES for this kind of
+    query which are not in the database, if the query has a problem."""
+    existing = existingIndexes(db)
+    result = []
+    for kind, sql in queries:
+        details = explain(db, sql)
+        found = problems(details)
+        proposals = [name for name, _, _, kinds in INDEXES
+                     if found and kind in kinds and name not in existing]
+        result.append((kind, sql, details, found, proposals))
+    return result
+
+
+def createStatement(name):
+    for indexName, table, columns, _ in INDEXES:
+        if indexName == name:
+            return f"create index if not exists {name} on {table} ({', '.join(columns)})"
+    raise KeyError(name)
+
+
+def printDiagnostics(diagnostics):
+    """Print the problems of the result of diagnose in the console."""
+    proposed = []
+    for kind, sql, details, found, proposals in diagnostics:
+        status = "; ".join(found) if found else "ok"
+        print(f"Enhance main window query plan: {kind}: {status}\n    {sql}\n    plan: {' | '.join(details)}",
+              file=sys.stderr)
+        for name in proposals:
+            if name not in proposed:
+                proposed.append(name)
+    for name in proposed:
+        print(f"Enhance main window proposed index: {createStatement(name)}", file=sys.stderr)
+
+
+def createIndexes(db):
+    """Create the indexes of INDEXES which are not in the database."""
+    existing = existingIndexes(db)
+    for name, _, _, _ in INDEXES:
+        if name not in existing:
+            db.execute(createStatement(name))
+
+
+def dropIndexes(db):
+    """Remove every index owned by the add-on, including the ones of older versions."""
+    for name in existingIndexes(db):
+        db.execute(f"drop index if exists {name}")
@@ -0,0 +1,163 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""The values of every deck and of every subtree, computed at once.
+
+Decks are numbered in pre-order, so that each deck comes after its
+parent. Values are stored in matrices with one row per deck and one
+column per element of VALUE_NAMES. NumPy is used when it is installed,
+otherwise each row is an array."""
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import tree
+from .dependencies import ANKI_VALUES, SUMS, VALUE_INDEX, VALUE_NAMES, neededValues
+
+# The initial values of a deck
+ZEROS = [0] * len(VALUE_NAMES)
+NOTES_INDEX = VALUE_INDEX["notes"]
+ANKI_INDEXES = [VALUE_INDEX[name] for name in ANKI_VALUES]
+
+
+class Rollup:
+    """The values of every deck.
+
+    dids -- the deck ids, in pre-order
+    index -- associate to each deck id its row
+    parents -- the row of the parent of each deck, -1 for top level decks
+    deckValues -- the values of each deck alone
+    subdeckValues -- the values of each deck and its descendants
+    timeDueDeck/timeDueSubdeck -- the first due time of learning cards of each deck (and its descendants), or None
+    """
+
+    def __init__(self, dids, parents, ankiCounts):
+        """
+        ankiCounts -- for each deck, the numbers of anki's ANKI_VALUES in the deck and its subdecks"""
+        self.dids = dids
+        self.parents = parents
+        self.index = {did: row for row, did in enumerate(dids)}
+        needed = neededValues()
+        sums = [(VALUE_INDEX[name], VALUE_INDEX[first], VALUE_INDEX[second], negate)
+                for name, first, second, negate in SUMS if name in needed]
+        if numpy is not None:
+            self.computeWithNumpy(ankiCounts, sums)
+        else:
+            self.computeWithPython(ankiCounts, sums)
+        if "notes" in needed:
+            for row, did in enumerate(dids):
+                self.deckValues[row][NOTES_INDEX] = tree.noteCounts["deck"].get(did, 0)
+                self.subdeckValues[row][NOTES_INDEX] = tree.noteCounts["subdeck"].get(did, 0)
+
+    def computeWithPython(self, ankiCounts, sums):
+        dids = self.dids
+        parents = self.parents
+        index = self.index
+        deckValues = [array("q", ZEROS) for _ in dids]
+        for name, values in tree.values.items():
+            column = VALUE_INDEX[name]
+            for did, value in values.items():
+                row = index.get(did)
+                if row is not None:
+                    deckValues[row][column] = value
+        # Anki gives values of subtrees. The deck's value is the subtree's one minus the children's subtree.
+        for row, counts in enumerate(ankiCounts):
+            for column, count in zip(ANKI_INDEXES, counts):
+                deckValues[row][column] += count
+                if parents[row] >= 0:
+                    deckValues[parents[row]][column] -= count
+        for values in deckValues:
+            for column, first, second, negate in sums:
+                values[column] = values[first] - values[second] if negate else values[first] + values[second]
+
+        timeDueDeck = [tree.times.get(did) for did in dids]
+        subdeckValues = [array("q", values) for values in deckValues]
+        timeDueSubdeck = list(timeDueDeck)
+        columns = range(len(VALUE_NAMES))
+        # Post-order: children are added to their parent before the parent is added to its own parent
+        for row in range(len(dids) - 1, -1, -1):
+            parent = parents[row]
+            if parent < 0:
+                continue
+            parentValues = subdeckValues[parent]
+            values = subdeckValues[row]
+            for column in columns:
+                parentValues[column] += values[column]
+            time = timeDueSubdeck[row]
+            if time and (not timeDueSubdeck[parent] or time < timeDueSubdeck[parent]):
+                timeDueSubdeck[parent] = time
+        self.deckValues = deckValues
+        self.subdeckValues = subdeckValues
+        self.timeDueDeck = timeDueDeck
+        self.timeDueSubdeck = timeDueSubdeck
+
+    def computeWithNumpy(self, ankiCounts, sums):
+        dids = self.dids
+        index = self.index
+        size = len(dids)
+        parents = numpy.array(self.parents, dtype=numpy.int64).reshape(size)
+        deckValues = numpy.zeros((size, len(VALUE_NAMES)), dtype=numpy.int64)
+        for name, values in tree.values.items():
+            rows = [index[did] for did in values if did in index]
+            deckValues[rows, VALUE_INDEX[name]] = [values[dids[row]] for row in rows]
+        # Anki gives values of subtrees. The deck's value is the subtree's one minus the children's subtree.
+        ankiCounts = numpy.array(ankiCounts, dtype=numpy.int64).reshape(size, len(ANKI_INDEXES))
+        hasParent = parents >= 0
+        childrenCounts = numpy.zeros_like(ankiCounts)
+        numpy.add.at(childrenCounts, parents[hasParent], ankiCounts[hasParent])
+        deckValues[:, ANKI_INDEXES] = ankiCounts - childrenCounts
+        for column, first, second, negate in sums:
+            if negate:
+                deckValues[:, column] = deckValues[:, first] - deckValues[:, second]
+            else:
+                deckValues[:, column] = deckValues[:, first] + deckValues[:, second]
+
+        # Falsy times are ignored in minimums
+        timeDueDeck = numpy.array([tree.times.get(did) or numpy.inf for did in dids], dtype=numpy.float64)
+        subdeckValues = deckValues.copy()
+        timeDueSubdeck = timeDueDeck.copy()
+        depths = numpy.zeros(size, dtype=numpy.int64)
+        for row, parent in enumerate(self.parents):
+            if parent >= 0:
+                depths[row] = depths[parent] + 1
+        # Post-order: the deepest decks are added to their parents first
+        for depth in range(int(depths.max(initial=0)), 0, -1):
+            rows = numpy.nonzero(depths == depth)[0]
+            numpy.add.at(subdeckValues, parents[rows], subdeckValues[rows])
+            numpy.minimum.at(timeDueSubdeck, parents[rows], timeDueSubdeck[rows])
+        self.deckValues = deckValues
+        self.subdeckValues = subdeckValues
+        self.timeDueDeck = [None if time == numpy.inf else int(time) for time in timeDueDeck]
+        self.timeDueSubdeck = [None if time == numpy.inf else int(time) for time in timeDueSubdeck]
+
+
+# The rollup of the last render, and the arguments it was computed with
+current = None
+currentKey = None
+
+
+def compute(dids, parents, ankiCounts):
+    """Set current to the values of the decks, unless nothing changed since the last call."""
+    global current, currentKey
+    key = (tree.generation, dids, parents, ankiCounts)
+    if current is None or key != currentKey:
+        current = Rollup(dids, parents, ankiCounts)
+        currentKey = key
+    return current
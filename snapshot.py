@@ -0,0 +1,95 @@
+# AGPL-3.0 License
+# Copyright (C) Arthur Milchior  2018 - 2023  <https://github.com/Arthur-Milchior>
+# Copyright (C) Shigeyuki 2024 <http://patreon.com/Shigeyuki>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""The values computed by tree.compute, saved in the add-on's user_files
+when the profile is closed, so that the deck list shows them at once
+when the profile is opened again and the collection did not change.
+
+A snapshot is a zlib compressed JSON file per collection. It is only
+used if it was saved for the same collection, modification time, day
+and needed values. This module does not depend on anki."""
+
+import hashlib
+import json
+import os
+import sys
+import zlib
+
+# Incremented when the content of snapshots changes, older snapshots are ignored
+FORMAT_VERSION = 1
+
+
+def snapshotPath(directory, collectionPath):
+    """The file of the snapshot of the collection at collectionPath."""
+    name = hashlib.sha1(collectionPath.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(directory, f"snapshot-{name}.json.z")
+
+
+def encodeKey(key):
+    path, mod, today, needed = key
+    return [path, mod, today, sorted(needed)]
+
+
+def intKeys(dictionary):
+    """dictionary with its keys, deck ids made strings by JSON, as int."""
+    return {int(did): value for did, value in dictionary.items()}
+
+
+def save(path, key, cutoff, queries, values, timeRows, counts):
+    """Write the snapshot of values computed for the collection key, see
+    tree.collectionKey and tree.compute. Print an error if it can't be written."""
+    deckCounts, subdeckCounts = counts
+    content = {
+        "version": FORMAT_VERSION,
+        "key": encodeKey(key),
+        "cutoff": cutoff,
+        "queries": queries,
+        "values": values,
+        "times": timeRows,
+        "deck notes": deckCounts,
+        "subdeck notes": subdeckCounts,
+    }
+    data = zlib.compress(json.dumps(content, separators=(",", ":")).encode("utf-8"))
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside then renamed, so that an interrupted write leaves the previous snapshot
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+    except OSError as error:
+        print(f"Enhance main window: the counters could not be saved in {path}: {error}", file=sys.stderr)
+
+
+def load(path, key):
+    """The (cutoff, queries, values, timeRows, counts) of the snapshot at
+    path, or None if there is none or it was saved for another key."""
+    try:
+        with open(path, "rb") as f:
+            content = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, zlib.error) as error:
+        print(f"Enhance main window: the saved counters in {path} can't be read: {error}", file=sys.stderr)
+        return None
+    if content.get("version") != FORMAT_VERSION or content.get("key") != encodeKey(key):
+        return None
+    return (content["cutoff"],
+            [tuple(query) for query in content["queries"]],
+            {name: intKeys(values) for name, values in content["values"].items()},
+            [tuple(row) for row in content["times"]],
+            (intKeys(content["deck notes"]), intKeys(content["subdeck notes"])))
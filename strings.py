@@ -24,7 +24,12 @@ from anki.stats import (
     colCum, # Added for completeness, as it was used in getColor
 )
 
-from .config import getUserOption
+import sys
+from collections import namedtuple
+
+from .config import getFromName, getUserOption, getVersion
+from .dependencies import COLUMN_NAMES, NOW_LATERS, PAIRS, VALUE_INDEX
+from .htmlAndCss import number_cell_template
 from .translations import tr, DEFAULT_LANG # Import tr and DEFAULT_LANG
 
 # Default English headers and overlays (used if a key is missing or for default logic)
@@ -95,3 +100,77 @@ def getColor(conf):
         if word in name.lower(): # Match case-insensitively for robustness
             return color
     return getUserOption("default column color", "grey")
+
+
+# What a displayed column needs to print its cells.
+# kind -- "deck" or "subdeck"
+# number -- "absolute", "percent" or "both"
+# index -- the index of name in the values, if the cell is simply this value written as an absolute number, else None
+# segments -- the tuple of (name, colour, overlay) of a bar, None for other columns
+# zero -- the "color zero" option
+# start, middle -- the parts of a number cell around the colour and the contents
+# colpos -- the position of the column in the configuration
+# header -- the text of the column's header
+ColumnSpec = namedtuple("ColumnSpec", ["kind", "number", "name", "index", "segments", "colour", "zero", "start", "middle",
+                                       "colpos", "header"])
+
+# The list of column in configuration which does not exists, and such that the user was already warned about it.
+warned = set()
+
+
+def compileColumns():
+    """The tuple of ColumnSpec of the displayed columns."""
+    compiled = []
+    for colpos, conf in enumerate(getUserOption("columns")):
+        if not conf.get("present", True):
+            continue
+        name = conf["name"]
+        if conf.get("percent", False):
+            if conf.get("absolute", False):
+                number = "both"
+            else:
+                number = "percent"
+        else:
+            number = "absolute"
+        kind = "subdeck" if conf.get("subdeck", False) else "deck"
+        segments = None
+        if name == "bar":
+            if not "names" in conf:
+                print("""A configuration whose name is "bar", should have a field "names".""", file=sys.stderr)
+                continue
+            segments = []
+            for barName in conf["names"]:
+                barConf = getFromName(barName) or {"name": barName}
+                overlay = getOverlay(barConf)
+                if overlay is None:
+                    overlay = f"Data for {barName}"  # Default if None
+                segments.append((barName, getColor(barConf), overlay))
+            segments = tuple(segments)
+        elif name not in COLUMN_NAMES:
+            if name not in warned:
+                warned.add(name)
+                print(
+                    f"The add-on anki_simplified_deck_stats does not know any column whose name is {name}. It thus won't be displayed. Please correct your add-on's configuration.", file=sys.stderr)
+            continue
+        # "learning now" may show the time before the next card instead of a
+        # number. Names such as "learning today" are both a value and a text.
+        hasText = name in PAIRS or name in NOW_LATERS or name in ("learning all", "learning now")
+        index = VALUE_INDEX.get(name) if number == "absolute" and not hasText else None
+        start, middle = number_cell_template(getOverlay(conf))
+        compiled.append(ColumnSpec(kind, number, name, index, segments, getColor(conf),
+                                   getUserOption("color zero"), start, middle, colpos, getHeader(conf)))
+    return tuple(compiled)
+
+
+# The result of compileColumns, and the configuration version for which it was computed
+plan = None
+planVersion = None
+
+
+def columnPlan():
+    """The ColumnSpec of the displayed columns, compiled once per configuration change."""
+    global plan, planVersion
+    if plan is None or planVersion != getVersion():
+        plan = compileColumns()
+        planVersion = getVersion()
+    return plan
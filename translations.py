@@ -4,7 +4,7 @@ from aqt import mw
 
 # Import getUserOption from your addon's config.py
 # Assuming config.py is in the same directory (root of the addon)
-from .config import getUserOption 
+from .config import getUserOption, getVersion
 
 # Supported languages
 SUPPORTED_LANGUAGES = ["en", "pt_BR"]
@@ -50,31 +50,64 @@ def get_language_code() -> str:
             
     return DEFAULT_LANG # Final fallback
 
-def tr(key: str, **kwargs: Any) -> str:
-    """Translates a key into the current language using maps from config.json."""
-    lang_code = get_language_code()
-    
+# The language of the current profile, computed once per profile load
+language = None
+
+
+def current_language() -> str:
+    """get_language_code, computed once until reset_language is called."""
+    global language
+    if language is None:
+        language = get_language_code()
+    return language
+
+
+def reset_language():
+    """Compute the language again at next translation. Called when a profile is opened."""
+    global language
+    language = None
+
+
+# The translation of each key in the current language, with the default
+# language's translation for keys missing in it. The language and
+# configuration version for which it was computed.
+table = None
+table_key = None
+
+
+def translation_table():
+    """The table of the current language, or None if config.json has no usable translation_maps.
+
+    It is computed again when the configuration changes (see config.update) or the language changes."""
+    global table, table_key
+    key = (current_language(), getVersion())
+    if table_key == key:
+        return table
+    table = None
     all_config = getUserOption()
     if not all_config:
         print(f"[Enhance Main Window Addon] Translation Error: Could not load addon configuration.")
-        return key
-
+        return None
     translation_maps = all_config.get("translation_maps")
     if not translation_maps or not isinstance(translation_maps, dict):
         print(f"[Enhance Main Window Addon] Translation Error: 'translation_maps' not found or not a dictionary in config.json.")
+        return None
+    table = dict(translation_maps.get(DEFAULT_LANG, {}))
+    table.update(translation_maps.get(key[0], {}))
+    table_key = key
+    return table
+
+
+def tr(key: str, **kwargs: Any) -> str:
+    """Translates a key into the current language using maps from config.json."""
+    current_table = translation_table()
+    if current_table is None:
         return key
+    lang_code = current_language()
 
-    default_lang_map = translation_maps.get(DEFAULT_LANG, {})
-    current_lang_map = translation_maps.get(lang_code, default_lang_map)
-    
-    text_template = current_lang_map.get(key)
-    found_in_current = text_template is not None
+    text_template = current_table.get(key)
 
-    if not found_in_current and lang_code != DEFAULT_LANG:
-        # Try fallback to DEFAULT_LANG if not already using it and key not in current lang
-        text_template = default_lang_map.get(key)
-    
-    if text_template is None: # Still not found in current or default language map
+    if text_template is None: # Not found in current or default language map
         print(f"[Enhance Main Window Addon] Translation Warning: Key '{key}' not found for language '{lang_code}' (nor in default '{DEFAULT_LANG}'). Displaying key name.")
         return key # Return key itself
     
@@ -86,16 +119,3 @@ def tr(key: str, **kwargs: Any) -> str:
     except Exception as e:
         print(f"[Enhance Main Window Addon] Unexpected error during translation of key '{key}': {e}")
         return key
-
-# Add a way to allow dynamic updates if Anki language changes during session
-# This is a simplified version. A more robust solution might involve hooks.
-def _update_translation_lang_if_needed():
-    # This function could be called periodically or on certain events
-    # to re-check mw.pm.meta if it's available.
-    # For now, get_language_code handles fallback if mw isn't ready.
-    pass
-
-if mw and hasattr(mw, "form") and hasattr(mw.form, "menuCol"):
-    # Example: try to refresh lang if some major UI part is available.
-    # This is just a conceptual placeholder for a better trigger.
-    pass 
\ No newline at end of file
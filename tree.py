@@ -14,92 +14,500 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+import sys
+from itertools import groupby
+from operator import itemgetter
+
 # from anki.utils import intTime
 from anki.utils import int_time
 
 from aqt import mw
 
+try:
+    from aqt.operations import QueryOp
+except ImportError:
+    # Anki older than 2.1.45
+    QueryOp = None
+
+from . import profiling, queryPlan, snapshot
+from .config import getUserOption
 from .consts import *
+from .dependencies import neededValues
+from .learning import LEARNING_QUERY, LearningIndex, noteQuery
+from .queries import (REPEATED_TODAY, cardDecksQuery, groupByQuery, newReviewsQuery,
+                      idRanges, queriesCardCount, repeatedToday, singlePassQuery,
+                      valuesPerQuery, valuesSinglePass)
 
 # Associate [column name][deck id name] to some value corresponding to
 # the number of card of this deck in this column
 values = dict()
+# The time until which cards in learning are counted as "now" in values
+cutoff = None
+# The list of (name, condition, addend, table) used to compute values
+counterQueries = []
 
 
-def computeValues():
+def prepareQueries():
+    """The cutoff, and the queries of the values needed by the columns."""
     # cutoff = intTime() + mw.col.get_config('collapseTime')
     cutoff = int_time() + mw.col.get_config('collapseTime')
-    # print("cutoff: ", cutoff)
-
     today = mw.col.sched.today
-    # print("today: ", today)
-    tomorrow = today+1
-    # yesterdayLimit = (mw.col.sched.dayCutoff-86400)*1000
-    yesterdayLimit = (mw.col.sched.day_cutoff-86400)*1000
-    # print("Yesterday limit is", yesterdayLimit)
-    queriesCardCount = ([
-        ("due tomorrow", f"queue in ({QUEUE_REV},{QUEUE_DAY_LRN}) and due = {tomorrow}", "", ""),
+    needed = neededValues()
+    return cutoff, [query for query in queriesCardCount(cutoff, today, yesterdayLimit())
+                    if query[0] in needed]
+
+
+def yesterdayLimit():
+    """The smallest revlog id of today"""
+    # return (mw.col.sched.dayCutoff-86400)*1000
+    return (mw.col.sched.day_cutoff-86400)*1000
+
+
+def notesNeeded():
+    """Whether a displayed column or bar uses the number of notes."""
+    return "notes" in neededValues()
 
-        # ("learning now from today", f"queue = {QUEUE_LRN} and due <= {cutoff}", "", ""),
-        ("learning today from past", f"queue = {QUEUE_DAY_LRN} and due <= {today}", "", ""),
-        # ("learning later today", f"queue = {QUEUE_LRN} and due > {cutoff}", "", ""),
-        ("learning future", f"queue = {QUEUE_DAY_LRN} and due > {today}", "", ""),
-        # ("learning today repetition from today", f"queue = {QUEUE_LRN}", f"left/1000", ""),
-        ("learning today repetition from past", f"queue = {QUEUE_DAY_LRN}", f"left/1000", ""),
-        # ("learning repetition from today", f"queue = {QUEUE_LRN}", f"mod%1000", ""),
-        ("learning repetition from past", f"queue = {QUEUE_DAY_LRN}", f"mod%1000", ""),
-
-
-        ("learning now from today", f"queue in ({QUEUE_LRN}, {QUEUE_PREVIEW}) and due <= {cutoff}", "", ""),
-        # ("learning today from past", f"queue in ({QUEUE_DAY_LRN}, {QUEUE_PREVIEW}) and due <= {today}", "", ""),
-        ("learning later today", f"queue in ({QUEUE_LRN}, {QUEUE_PREVIEW}) and due > {cutoff}", "", ""),
-        # ("learning future", f"queue in ({QUEUE_DAY_LRN}, {QUEUE_PREVIEW}) and due > {today}", "", ""),
-        ("learning today repetition from today", f"queue in ({QUEUE_LRN}, {QUEUE_PREVIEW})", f"left/1000", ""),
-        # ("learning today repetition from past", f"queue in ({QUEUE_DAY_LRN}, {QUEUE_PREVIEW})", f"left/1000", ""),
-        ("learning repetition from today", f"queue in ({QUEUE_LRN}, {QUEUE_PREVIEW})", f"mod%1000", ""),
-        # ("learning repetition from past", f"queue in ({QUEUE_DAY_LRN}, {QUEUE_PREVIEW})", f"mod%1000", ""),
-
-
-        ("review due", f"queue = {QUEUE_REV} and due <= {today}", "", ""),
-        ("reviewed today", f"queue = {QUEUE_REV} and due>0 and due-ivl = {today}", "", ""),
-        ("repeated today", f"revlog.id>{yesterdayLimit}", "", "revlog inner join cards on revlog.cid = cards.id"),
-        
-        ("unseen", f"queue = {QUEUE_NEW_CRAM}", "", ""),
-        ("buried", f"queue = {QUEUE_USER_BURIED}  or queue = {QUEUE_SCHED_BURIED}", "", ""),
-        ("suspended", f"queue = {QUEUE_SUSPENDED}", "", ""),
-        ("cards", "", "", ""),
-        ("undue", f"queue = {QUEUE_REV} and due >  {today}", "", ""),
-        ("mature", f"queue = {QUEUE_REV} and ivl >= 21", "", ""),
-        ("young", f"queue = {QUEUE_REV} and 0<ivl and ivl <21", "", ""),
-    ])
-    for name, condition, addend, table in queriesCardCount:
-        if addend:
-            element = f" sum({addend})"
-        else:
-            element = f" count(*)"
-        if condition:
-            condition = f" where {condition}"
-        if not table:
-            table = "cards"
-        query = f"select did, {element} from {table} {condition} group by did"
-        results = mw.col.db.all(query)
-        # print("")
-        # print("======================================")
-        # print(f""" >>> {name} \n query:"{query}" """)
-        # print(f"Results: {results}")
-        values[name] = dict()
-        for did, value in results:
-            # print(f"did:{did} value:{value} name:{name}")
-            values[name][did] = value
 
+# Associate [deck/subdeck][deck id] to the number of distinct notes of the deck (and its subdecks)
+noteCounts = {"deck": dict(), "subdeck": dict()}
+NOTES_QUERY = "select nid, did from cards order by nid"
+# The parents noteCounts was computed with, None if unknown
+notesParents = None
+# The parents of the decks at the last render, see refreshParents
+currentParents = None
 
+
+def notesQuery(nidRange=None):
+    """NOTES_QUERY, restricted to the notes whose id is between the (first, last) of nidRange if given."""
+    if nidRange is None:
+        return NOTES_QUERY
+    return f"select nid, did from cards where nid between {int(nidRange[0])} and {int(nidRange[1])} order by nid"
+
+
+def countNotes(db, parents, nidRange=None):
+    """The number of distinct notes of each deck and of each subtree, as values of noteCounts.
+
+    parents -- associate to each deck id the id of its parent deck (None for top level decks)
+    nidRange -- if given, only the notes whose id is in this (first, last) range are counted
+
+    Cards are read ordered by note, so that each note is counted once
+    in each ancestor of its decks without keeping sets of nids."""
+    deckCounts = dict()
+    subdeckCounts = dict()
+    with profiling.timed("notes query") as timer:
+        rows = db.all(notesQuery(nidRange))
+        timer.rows = len(rows)
+    with profiling.timed("notes count"):
+        for nid, group in groupby(rows, key=itemgetter(0)):
+            ancestors = set()
+            for did in set(map(itemgetter(1), group)):
+                deckCounts[did] = deckCounts.get(did, 0) + 1
+                while did is not None and did not in ancestors:
+                    ancestors.add(did)
+                    did = parents.get(did)
+            for did in ancestors:
+                subdeckCounts[did] = subdeckCounts.get(did, 0) + 1
+    return deckCounts, subdeckCounts
+
+
+# Associate to deck ids the first due time of their cards in learning, or None
 times = dict()
+# The first due time after cutoff of a card in learning. Once it is
+# reached, the values of learning cards change.
+nextLearningDue = None
+# The cards in learning, from which times and nextLearningDue are computed
+learningIndex = LearningIndex()
+
+
+def timeQuery(where="", limit=None):
+    """The first due time of learning cards of each deck, and the first one after limit (by default cutoff),
+    by a scan of cards. Used to check learningIndex, see checkConsistency."""
+    if limit is None:
+        limit = cutoff
+    return f"select did,min(case when queue = {QUEUE_LRN} then due else null end), min(case when queue in ({QUEUE_LRN}, {QUEUE_PREVIEW}) and due > {limit} then due else null end) from cards {where} group by did"
+
+
+def updateTimes(rows):
+    """Update learningIndex, times and nextLearningDue with the new state
+    (id, did, due, queue) of some cards."""
+    global nextLearningDue
+    times.update(learningIndex.times(learningIndex.update(rows)))
+    nextLearningDue = learningIndex.nextDue(cutoff)
+
+
+# The collection's state for which values, times and noteCounts were computed
+computedKey = None
+# Incremented each time values, times or noteCounts change
+generation = 0
+
+
+def collectionKey():
+    """Everything the computed values depend on, apart from the current time."""
+    return (mw.col.path, mw.col.mod, mw.col.sched.today, neededValues())
+
+
+def upToDate():
+    """Whether values, times and noteCounts are still valid."""
+    if computedKey != collectionKey():
+        return False
+    if notesNeeded() and notesParents is not None and notesParents != currentParents:
+        return False
+    return nextLearningDue is None or int_time() + mw.col.get_config('collapseTime') < nextLearningDue
+
+
+# The state of queries.repeatedToday after the last computation
+repeatedState = None
+# Incremented each time cards may have changed deck, see forgetRepeated
+cardMoves = 0
+
+
+def forgetRepeated():
+    """Read today's reviews and the decks of their cards again at the next computation."""
+    global repeatedState, cardMoves
+    repeatedState = None
+    cardMoves += 1
+
+
+def prepare():
+    """What compute needs from the main thread: the collection key, the
+    cutoff, the queries, whether notes are counted, the limit of today's
+    revlog ids, and repeatedState with its cardMoves"""
+    cutoff, queries = prepareQueries()
+    return collectionKey(), cutoff, queries, notesNeeded(), yesterdayLimit(), (cardMoves, repeatedState)
+
+
+def addValues(total, values):
+    """Add to the dictionary total the values of each of its keys in values."""
+    for did, value in values.items():
+        total[did] = total.get(did, 0) + value
+
+
+# The number of cards read by each scan of compute. In background, anki's
+# connection is released between scans, so that the main thread can use it.
+CHUNK_CARDS = 20_000
+# The column of cards by which the counters' scan is split. By deck when
+# the add-on's index covers the counters, see checkIndexes: each part is
+# then a search of the index. Otherwise by card id, a search of the table.
+chunkColumn = "id"
+
+
+def cardChunks(db, column):
+    """The ranges of `column` splitting cards in parts of about CHUNK_CARDS cards."""
+    first, last, count = db.all(f"select min({column}), max({column}), count() from cards")[0]
+    return idRanges(first, last, max(1, -(-count // CHUNK_CARDS)))
+
+
+def compute(db, prepared, parents, isStale=lambda: False):
+    """Run the queries of prepared. Does not change this module, so
+    that it can run in a background thread; see install.
+
+    The scans of cards are split by cardChunks. Return None if isStale()
+    becomes true between two queries."""
+    key, cutoff, queries, notes, limit, (moves, state) = prepared
+    cardQueries = [query for query in queries if not query[3]]
+    computedValues = {query[0]: dict() for query in cardQueries}
+    if cardQueries:
+        column = chunkColumn
+        for idRange in cardChunks(db, column):
+            for name, values in valuesSinglePass(db, cardQueries, idRange=idRange, rangeColumn=column).items():
+                addValues(computedValues[name], values)
+            if isStale():
+                return None
+    computedValues.update(valuesPerQuery(db, [query for query in queries if query[3] and query[0] != REPEATED_TODAY]))
+    if isStale():
+        return None
+    if any(query[0] == REPEATED_TODAY for query in queries):
+        computedValues[REPEATED_TODAY], state = repeatedToday(db, limit, state)
+    with profiling.timed("times") as timer:
+        timeRows = db.all(LEARNING_QUERY)
+        timer.rows = len(timeRows)
+    if isStale():
+        return None
+    deckCounts, subdeckCounts = dict(), dict()
+    if notes:
+        for nidRange in cardChunks(db, "nid"):
+            deckCountsOfRange, subdeckCountsOfRange = countNotes(db, parents, nidRange)
+            addValues(deckCounts, deckCountsOfRange)
+            addValues(subdeckCounts, subdeckCountsOfRange)
+            if isStale():
+                return None
+    counts = deckCounts, subdeckCounts
+    return key, cutoff, queries, computedValues, timeRows, counts, (moves, state)
+
 
+def install(computed, parents=None):
+    """Replace values, times and noteCounts by the result of compute.
 
-def computeTime():
+    parents -- the parents compute was called with, None if unknown"""
+    global computedKey, cutoff, counterQueries, nextLearningDue, learningIndex, generation, repeatedState, notesParents
+    key, cutoff, counterQueries, computedValues, timeRows, (deckCounts, subdeckCounts), (moves, state) = computed
+    # Decks of cards read before a move are not kept
+    if moves == cardMoves:
+        repeatedState = state
+    values.clear()
+    values.update(computedValues)
     times.clear()
-    for did, time in mw.col.db.all(f"select did,min(case when queue = {QUEUE_LRN} then due else null end) from cards group by did"):
-        times[did] = time
+    learningIndex = LearningIndex(timeRows)
+    times.update(learningIndex.times())
+    nextLearningDue = learningIndex.nextDue(cutoff)
+    noteCounts["deck"] = deckCounts
+    noteCounts["subdeck"] = subdeckCounts
+    notesParents = parents
+    computedKey = key
+    generation += 1
+
+
+def clear():
+    """Forget every value, as if every deck were empty."""
+    global computedKey, nextLearningDue, learningIndex, generation, notesParents
+    values.clear()
+    times.clear()
+    nextLearningDue = None
+    learningIndex = LearningIndex()
+    noteCounts["deck"] = dict()
+    noteCounts["subdeck"] = dict()
+    notesParents = None
+    computedKey = None
+    generation += 1
+
+
+def computeAll(parents):
+    """Compute values, times and noteCounts, unless the collection did not change since last time."""
+    if upToDate():
+        return
+    install(compute(mw.col.db, prepare(), parents), parents)
+
+
+#####################
+# Computation in background
+#####################
+# Functions called without argument, on the main thread, after values
+# computed in background or loaded from a snapshot are installed
+onComputed = []
+# Number of computations started in background. Only the last one is not stale.
+requested = 0
+# The collection key of the computation running in background, if any
+running = None
+
+
+def canComputeInBackground():
+    return QueryOp is not None and getUserOption("compute in background", True)
+
+
+def computeAllInBackground(parents):
+    """Start computing values, times and noteCounts in a background
+    thread, unless they are up to date or already being computed. A
+    computation which is still running becomes stale, and stops.
+
+    Values computed for another state of the collection are cleared, so
+    that until the result arrives, only the numbers anki computed are
+    displayed. Values which only expired with time are kept."""
+    global requested, running
+    if upToDate():
+        return
+    if computedKey != collectionKey():
+        clear()
+    prepared = prepare()
+    if running == prepared[0]:
+        return
+    requested += 1
+    request = requested
+    running = prepared[0]
+
+    def isStale():
+        return request != requested
+
+    def success(computed):
+        global running
+        if isStale() or computed is None:
+            return
+        running = None
+        install(computed, parents)
+        for callback in onComputed:
+            callback()
+
+    def failure(error):
+        global running
+        if not isStale():
+            running = None
+        print(f"Enhance main window: the counters could not be computed: {error}", file=sys.stderr)
+
+    QueryOp(
+        parent=mw,
+        op=lambda col: compute(col.db, prepared, parents, isStale),
+        success=success,
+    ).failure(failure).run_in_background()
+
+
+#####################
+# Snapshot
+#####################
+def snapshotFile():
+    """The file of the snapshot of the current collection, in the add-on's user_files."""
+    return snapshot.snapshotPath(os.path.join(os.path.dirname(__file__), "user_files"), mw.col.path)
+
+
+def saveSnapshot():
+    """Save values, times and noteCounts in a snapshot, if they are up to
+    date and the option "save counters on close" is set."""
+    if mw.col is None or not getUserOption("save counters on close", True) or computedKey != collectionKey():
+        return
+    snapshot.save(snapshotFile(), computedKey, cutoff, counterQueries, values, learningIndex.rows(),
+                  (noteCounts["deck"], noteCounts["subdeck"]))
+
+
+def loadSnapshot():
+    """Install the snapshot of the collection, if it is still valid and
+    nothing was computed yet. Values whose cards in learning became due
+    since are computed again at the next render."""
+    if mw.col is None or not getUserOption("save counters on close", True):
+        return
+    key = collectionKey()
+    if computedKey == key:
+        return
+    with profiling.timed("snapshot"):
+        loaded = snapshot.load(snapshotFile(), key)
+    if loaded is None:
+        return
+    savedCutoff, queries, savedValues, timeRows, counts = loaded
+    install((key, savedCutoff, queries, savedValues, timeRows, counts, (cardMoves, None)))
+    for callback in onComputed:
+        callback()
+
+
+#####################
+# Updates after a review
+#####################
+# Associate to the note being answered the values of its cards before the answer
+beforeAnswerValues = dict()
+
+
+def noteValues(nid):
+    return valuesSinglePass(mw.col.db, counterQueries, nid)
+
+
+def beforeAnswer(card):
+    """Save the values of the card's note, if the values are up to date."""
+    beforeAnswerValues.clear()
+    if upToDate():
+        beforeAnswerValues[card.nid] = noteValues(card.nid)
+
+
+def afterAnswer(card):
+    """Update values and times with the difference between the card's
+    note before and after the answer. Burying siblings is thus taken into account.
+
+    If the note's cards moved to another deck, noteCounts can't be
+    updated, so everything is computed again at next render."""
+    global computedKey, generation
+    if card.odid:
+        # The card may go back to its home deck
+        forgetRepeated()
+    before = beforeAnswerValues.pop(card.nid, None)
+    if before is None or computedKey is None:
+        return
+    after = noteValues(card.nid)
+    if set(before["cards"]) != set(after["cards"]):
+        computedKey = None
+        return
+    for name in after:
+        for did, value in before[name].items():
+            values[name][did] = values[name].get(did, 0) - value
+        for did, value in after[name].items():
+            values[name][did] = values[name].get(did, 0) + value
+    updateTimes(mw.col.db.all(noteQuery(card.nid)))
+    computedKey = collectionKey()
+    generation += 1
+    if getUserOption("check delta updates", False):
+        checkConsistency()
+
+
+def onOperationDidExecute(changes, handler=None):
+    """Keep values valid after operations which do not change cards, such
+    as selecting, collapsing or renaming a deck. Values are kept by deck
+    id, so only the notes of subdecks depend on decks, see
+    refreshParents. Operations changing cards make the values outdated,
+    unless it's an answer."""
+    global computedKey
+    if changes.card and handler is not mw.reviewer:
+        forgetRepeated()
+    if computedKey is None or changes.card or changes.note_text or changes.notetype:
+        return
+    path, _, today, needed = computedKey
+    key = collectionKey()
+    if key[0] == path and key[2:] == (today, needed):
+        computedKey = key
+
+
+def refreshParents(parents):
+    """Record the parents of the decks, before the values are computed.
+    If decks moved in the tree since the notes were counted, upToDate is
+    false, so that they are counted again with the other values, in
+    background if possible. Other values don't depend on the tree."""
+    global currentParents, notesParents
+    currentParents = parents
+    if notesParents is None and computedKey is not None:
+        # Loaded from a snapshot, whose collection had the same decks
+        notesParents = parents
+
+
+def checkConsistency():
+    """Compare the values updated after each review with a full computation. Print differences."""
+    expected = valuesSinglePass(mw.col.db, counterQueries)
+    for name in expected:
+        for did in set(expected[name]) | set(values[name]):
+            if expected[name].get(did, 0) != values[name].get(did, 0):
+                print(f"Enhance main window: {name} for deck {did} is {values[name].get(did, 0)} after updates instead of {expected[name].get(did, 0)}.", file=sys.stderr)
+    for did, time, _ in mw.col.db.all(timeQuery()):
+        if time != times.get(did):
+            print(f"Enhance main window: first learning card of deck {did} is due at {times.get(did)} after updates instead of {time}.", file=sys.stderr)
+
+
+def deckSignature(did):
+    """Everything computed here about deck did. Decks whose signature did not change need not be recomputed."""
+    return (tuple(values[name].get(did, 0) for name in values),
+            times.get(did),
+            noteCounts["deck"].get(did),
+            noteCounts["subdeck"].get(did))
+
+
+#####################
+# Query plans
+#####################
+def queryTexts():
+    """The (kind, sql) of the queries run by compute with the current
+    configuration. Kinds are the ones of queryPlan.INDEXES, or the
+    counter's name for queries on another table."""
+    cutoff, queries = prepareQueries()
+    # As the first part of cardChunks
+    texts = [("counters", singlePassQuery(queries, idRange=(0, CHUNK_CARDS), rangeColumn=chunkColumn))]
+    texts.extend((name, groupByQuery(condition, addend, table))
+                 for name, condition, addend, table in queries if table and name != REPEATED_TODAY)
+    if any(query[0] == REPEATED_TODAY for query in queries):
+        texts.append((REPEATED_TODAY, newReviewsQuery(yesterdayLimit())))
+        texts.append((REPEATED_TODAY, cardDecksQuery([0])))
+    texts.append(("times", LEARNING_QUERY))
+    if notesNeeded():
+        texts.append(("notes", notesQuery((0, CHUNK_CARDS))))
+    return texts
+
+
+def checkIndexes():
+    """Create the add-on's indexes if the option "add-on indexes" is set,
+    otherwise drop them. Print the query plans if the option "diagnose
+    queries" is set."""
+    global chunkColumn
+    if mw.col is None:
+        return
+    if getUserOption("add-on indexes", False):
+        queryPlan.createIndexes(mw.col.db)
+        chunkColumn = "did"
+    else:
+        queryPlan.dropIndexes(mw.col.db)
+        chunkColumn = "id"
+    if getUserOption("diagnose queries", False):
+        queryPlan.printDiagnostics(queryPlan.diagnose(mw.col.db, queryTexts()))
 
 
 